@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Admission control for NBS - Newtown Bill Splitter App
+Concurrency limits with bounded wait queues per pipeline stage, and per-client token buckets.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class Overloaded(Exception):
+    """Raised when a request is turned away; ``retry_after`` is a suggested wait in whole seconds"""
+
+    def __init__(self, message: str, retry_after: int, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class StageLimiter:
+    """
+    Lets at most ``limit`` callers into a stage at once.
+
+    Callers beyond the limit wait their turn in arrival order. With
+    ``max_queue`` set, a caller finding that many already waiting is turned
+    away at once, and one still waiting after ``max_wait`` seconds gives up;
+    both raise Overloaded. Without ``max_queue`` callers wait as long as it
+    takes, which suits stages that sit behind a bounded limiter already.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self._waiting: deque = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        # Moving average of how long callers stay in the stage, for Retry-After
+        self._service_seconds = 1.0
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """
+        Run a block (or, as a decorator, a function) once a slot is free;
+        raises Overloaded when turned away
+        """
+        self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'active': self.active,
+                'queued': len(self._waiting),
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'mean_seconds': round(self._service_seconds, 3),
+            }
+
+    def _acquire(self):
+        with self._condition:
+            if self.active < self.limit and not self._waiting:
+                self.active += 1
+                self.admitted += 1
+                return
+            if self.max_queue is not None and len(self._waiting) >= self.max_queue:
+                self.rejected['queue_full'] += 1
+                raise Overloaded(f'{self.name} is at capacity ({len(self._waiting)} waiting)',
+                                 self._retry_after(), 'queue_full')
+
+            ticket = object()
+            self._waiting.append(ticket)
+            deadline = None if self.max_wait is None else time.monotonic() + self.max_wait
+            try:
+                while not (self.active < self.limit and self._waiting[0] is ticket):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.rejected['timeout'] += 1
+                        raise Overloaded(f'Timed out waiting for {self.name}', self._retry_after(), 'timeout')
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # The next in line may be able to go now (or is the new head of the queue)
+                self._condition.notify_all()
+            self.active += 1
+            self.admitted += 1
+
+    def _release(self, seconds: float):
+        with self._condition:
+            self.active -= 1
+            self._service_seconds += (seconds - self._service_seconds) * 0.2
+            self._condition.notify_all()
+
+    def _retry_after(self) -> int:
+        # Everyone queued ahead, served ``limit`` at a time
+        rounds = (len(self._waiting) + 1) / self.limit
+        return max(1, math.ceil(rounds * self._service_seconds))
+
+
+class RateLimiter:
+    """
+    A token bucket per client: ``burst`` requests at once, refilled at
+    ``rate`` per second. A request costing more than ``burst`` (a big bulk
+    upload) is let through only from a full bucket, which it leaves in debt:
+    it still pays one token per unit, by waiting longer before the next one.
+    Only the ``max_clients`` most recently seen clients are tracked; a client
+    that was dropped simply starts with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str, cost: float = 1) -> float:
+        """
+        Take ``cost`` tokens from the client's bucket. Returns 0 when allowed,
+        otherwise the seconds until enough tokens will be there.
+        """
+        if not self.enabled:
+            return 0.0
+        # Tokens needed in the bucket; a cost above the burst may take the bucket below zero
+        needed = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= needed:
+                tokens -= cost
+                self.allowed += 1
+                wait = 0.0
+            else:
+                self.limited += 1
+                wait = (needed - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'clients': len(self._buckets),
+                    'allowed': self.allowed, 'limited': self.limited}
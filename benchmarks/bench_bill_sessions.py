@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Bill session benchmark for NBS - Newtown Bill Splitter App
+Times one delta on a bill session against recalculating the whole bill, and checks that the
+session's figures (including what a client sees after merging only the changed members) match
+calculate_totals on random bills and delta sequences, half-cent ties included.
+
+Usage:
+    python benchmarks/bench_bill_sessions.py [--sizes 5x10,20x200,50x500] [--random 2000] [--json out.json]
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_split_engine import make_bill
+from bill_sessions import BillSession
+from nbs_billsplitter_app import app, calculate_totals
+
+DEFAULT_SIZES = '5x10,20x200,50x500'
+
+# M0 owns 22.99 + 21.03 / 2 + 21.79 = 55.295 exactly, which the float loop rounds down to 55.29
+TIE_BILL = (['M0', 'M1', 'M2'], [
+    {'name': 'A', 'price': 22.99, 'assignedTo': ['M0']},
+    {'name': 'B', 'price': 21.03, 'assignedTo': ['M0', 'M1']},
+    {'name': 'C', 'price': 21.79, 'assignedTo': ['M0']},
+], 0)
+
+
+def identical(expected, actual):
+    return json.dumps(expected, sort_keys=True) == json.dumps(actual, sort_keys=True)
+
+
+def random_delta(rng, members, items, step):
+    roll = rng.random()
+    if roll < 0.5:
+        return {'op': 'toggle', 'item': rng.randrange(len(items)), 'member': rng.choice(members)}
+    if roll < 0.75:
+        return {'op': 'set_price', 'item': rng.randrange(len(items)), 'price': rng.randint(1, 9999) / 100}
+    if roll < 0.85:
+        return {'op': 'set_discount', 'discount': rng.choice([0, 5, 10, 12.5, round(rng.uniform(0, 40), 2)])}
+    return {'op': 'add_item', 'name': f'New {step}', 'price': rng.randint(1, 5000) / 100,
+            'assignedTo': [member for member in members if rng.random() < 0.5]}
+
+
+def apply_to_bill(delta, items, discount):
+    """The same delta on a plain bill, for calculate_totals; returns the new discount"""
+    if delta['op'] == 'toggle':
+        assigned = items[delta['item']]['assignedTo']
+        if delta['member'] in assigned:
+            assigned.remove(delta['member'])
+        else:
+            assigned.append(delta['member'])
+    elif delta['op'] == 'set_price':
+        items[delta['item']]['price'] = delta['price']
+    elif delta['op'] == 'set_discount':
+        return float(delta['discount'])
+    else:
+        items.append({'name': delta['name'], 'price': delta['price'], 'assignedTo': list(delta['assignedTo'])})
+    return discount
+
+
+def check_bill(members, items, discount, rng=None, steps=0):
+    """
+    True if the session matches calculate_totals after creation and after each of ``steps``
+    random deltas (``items`` is changed along with the session)
+    """
+    session = BillSession(members, copy.deepcopy(items), discount)
+    shown = session.totals()
+    if not identical(calculate_totals(members, items, discount), shown):
+        return False
+    for step in range(steps):
+        delta = random_delta(rng, members, items, step)
+        changed = session.apply([delta])
+        # What the page holds: the previous figures with only the changed members replaced
+        update = session.totals(changed)
+        shown['member_totals'].update(update.pop('member_totals'))
+        shown.update(update)
+        discount = apply_to_bill(delta, items, discount)
+        expected = calculate_totals(members, items, discount)
+        if not identical(expected, session.totals()) or not identical(expected, shown):
+            return False
+    return True
+
+
+def check_random_bills(count, steps=10):
+    """Seeds of random bills and delta sequences where the session and calculate_totals disagree"""
+    mismatches = []
+    for seed in range(count):
+        rng = random.Random(seed)
+        members = [f'Member {i}' for i in range(rng.randint(1, 6))]
+        items = []
+        for i in range(rng.randint(1, 12)):
+            assigned = [member for member in members if rng.random() < 0.5]
+            if rng.random() < 0.05:
+                assigned.append('Guest')
+            price = rng.choice([rng.randint(1, 9999) / 100, rng.randint(1, 99) / 10, rng.randint(0, 30)])
+            items.append({'name': f'Item {i}', 'price': price, 'assignedTo': assigned})
+        discount = rng.choice([0, 10, 12.5, round(rng.uniform(0, 40), 2)])
+        if not check_bill(members, items, discount, rng, steps):
+            mismatches.append(seed)
+    return mismatches
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bill session deltas and check them against calculate_totals')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated MEMBERSxITEMS')
+    parser.add_argument('--density', type=float, default=0.3, help='chance a member shares an item')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--random', type=int, default=2000, help='random bills to check for identical results')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    # Compare against the Python loop whatever the bill size
+    app.config['SPLIT_ENGINE_MIN_CELLS'] = float('inf')
+
+    results = []
+    print(f"{'members x items':>16} {'delta ms':>10} {'full ms':>10} {'speedup':>8}")
+    for size in args.sizes.split(','):
+        member_count, item_count = (int(part) for part in size.lower().split('x'))
+        members, items = make_bill(member_count, item_count, args.density)
+        session = BillSession(members, copy.deepcopy(items), 10)
+        toggle = [{'op': 'toggle', 'item': item_count // 2, 'member': members[0]}]
+
+        def one_delta():
+            session.totals(session.apply(toggle))
+
+        delta_time = best_time(one_delta, args.repeat)
+        full_time = best_time(lambda: calculate_totals(members, items, 10), args.repeat)
+        results.append({'members': member_count, 'items': item_count, 'delta_ms': delta_time * 1000,
+                        'full_ms': full_time * 1000, 'speedup': full_time / delta_time})
+        print(f"{size:>16} {delta_time * 1000:>10.3f} {full_time * 1000:>10.3f} {full_time / delta_time:>7.1f}x")
+
+    members, items, discount = TIE_BILL
+    tie_ok = check_bill(members, copy.deepcopy(items), discount)
+    mismatches = check_random_bills(args.random)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'density': args.density, 'results': results, 'tie_bill_identical': tie_ok,
+                       'random_bills': args.random, 'random_mismatches': mismatches}, f, indent=2)
+        print(f"\n📝 Results written to {args.json}")
+
+    if not tie_ok or mismatches:
+        print(f"\n❌ Sessions disagree with calculate_totals (half-cent tie bill: "
+              f"{'ok' if tie_ok else 'differs'}, random bill seeds: {mismatches[:10]})")
+        return 1
+    print(f"\n✅ Identical to calculate_totals on the half-cent tie bill and {args.random} random bills")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Gemini payload benchmark for NBS - Newtown Bill Splitter App
+Reports how many bytes each receipt costs as the original upload and as the optimized Gemini
+payload. With --call (needs GEMINI_API_KEY) it also sends the corpus to Gemini three ways -
+original images, optimized images one per call, optimized images batched - and checks the
+optimized paths against the original one for item precision and recall.
+
+Usage:
+    python benchmarks/bench_gemini_payload.py [image_dir] [--truth benchmarks/receipts_truth.json]
+        [--max-edge 1600] [--quality 75] [--call] [--batch-size 4] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pipeline import DEFAULT_TRUTH, load_corpus, load_truth, match_items
+from nbs_billsplitter_app import app, decode_image, extract_text_with_gemini, gemini_batcher, prepare_gemini_image
+
+PATHS = (
+    ('original', False, 1),
+    ('optimized', True, 1),
+    ('optimized_batched', True, None),
+)
+
+
+def payload_sizes(corpus):
+    sizes = []
+    for name, _, image_bytes in corpus:
+        payload = prepare_gemini_image(decode_image(image_bytes))
+        sizes.append({'image': name, 'upload_bytes': len(image_bytes), 'payload_bytes': len(payload['data'])})
+    return sizes
+
+
+def run_path(corpus, truth, optimize, batch_size, name_threshold):
+    """Send every receipt to Gemini at once (so batches can fill) and score the items"""
+    app.config['GEMINI_OPTIMIZE_PAYLOAD'] = optimize
+    gemini_batcher.max_batch = batch_size
+    before = gemini_batcher.stats()
+    images = [decode_image(image_bytes) for _, _, image_bytes in corpus]
+
+    def extract(image):
+        start = time.perf_counter()
+        return extract_text_with_gemini(image), time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(images)) as pool:
+        outcomes = list(pool.map(extract, images))
+
+    after = gemini_batcher.stats()
+    found = expected = matched = 0
+    for (name, _, _), (items, _) in zip(corpus, outcomes):
+        if name in truth:
+            found += len(items)
+            expected += len(truth[name])
+            matched += match_items(items, truth[name], name_threshold)
+    result = {
+        'calls': after['batches'] - before['batches'],
+        'receipts': len(images),
+        'receipts_with_items': sum(1 for items, _ in outcomes if items),
+        'p50_seconds': round(statistics.median(seconds for _, seconds in outcomes), 3),
+    }
+    if expected:
+        result['precision'] = round(matched / found, 4) if found else 0.0
+        result['recall'] = round(matched / expected, 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure and check the optimized Gemini payloads')
+    parser.add_argument('image_dir', nargs='?', default='uploads')
+    parser.add_argument('--truth', default=DEFAULT_TRUTH, help='ground truth JSON (default: %(default)s)')
+    parser.add_argument('--max-edge', type=int, default=app.config['GEMINI_MAX_EDGE'])
+    parser.add_argument('--quality', type=int, default=app.config['GEMINI_JPEG_QUALITY'])
+    parser.add_argument('--call', action='store_true', help='send the corpus to Gemini and compare accuracy')
+    parser.add_argument('--batch-size', type=int, default=max(app.config['GEMINI_BATCH_SIZE'], 2))
+    parser.add_argument('--name-threshold', type=float, default=0.6,
+                        help='minimum name similarity (0-1) for a found item to count as correct')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.05,
+                        help='allowed precision/recall drop of the optimized paths against the original')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.image_dir)
+    if not corpus:
+        print(f"❌ No images found in {args.image_dir}")
+        return 1
+    app.config['GEMINI_MAX_EDGE'] = args.max_edge
+    app.config['GEMINI_JPEG_QUALITY'] = args.quality
+
+    sizes = payload_sizes(corpus)
+    upload_total = sum(size['upload_bytes'] for size in sizes)
+    payload_total = sum(size['payload_bytes'] for size in sizes)
+    print(f"🧾 {len(corpus)} images, long edge {args.max_edge}px, JPEG quality {args.quality}")
+    for size in sizes:
+        print(f"   {size['image'][:48]:<48} {size['upload_bytes'] / 1024:>8.0f} KB -> {size['payload_bytes'] / 1024:>6.0f} KB")
+    print(f"📦 {upload_total / len(sizes) / 1024:.0f} KB -> {payload_total / len(sizes) / 1024:.0f} KB per receipt "
+          f"({payload_total / upload_total:.0%} of the upload)")
+    results = {'max_edge': args.max_edge, 'quality': args.quality, 'images': sizes,
+               'upload_bytes_per_receipt': upload_total / len(sizes),
+               'payload_bytes_per_receipt': payload_total / len(sizes)}
+
+    problems = []
+    if args.call:
+        if not os.getenv('GEMINI_API_KEY'):
+            print("❌ GEMINI_API_KEY is not set; --call needs it")
+            return 1
+        truth = load_truth(args.truth, args.image_dir, corpus)
+        results['paths'] = {}
+        for name, optimize, batch_size in PATHS:
+            print(f"⏱️  {name}")
+            results['paths'][name] = run_path(corpus, truth, optimize, batch_size or args.batch_size,
+                                              args.name_threshold)
+
+        print(f"\n{'path':<20} {'calls/rcpt':>10} {'p50 s':>7} {'prec':>6} {'recall':>6}")
+        for name, result in results['paths'].items():
+            precision = f"{result['precision']:.2f}" if 'precision' in result else '-'
+            recall = f"{result['recall']:.2f}" if 'recall' in result else '-'
+            print(f"{name:<20} {result['calls'] / result['receipts']:>10.2f} {result['p50_seconds']:>7.2f} "
+                  f"{precision:>6} {recall:>6}")
+
+        original = results['paths']['original']
+        for name, result in results['paths'].items():
+            for metric in ('precision', 'recall'):
+                if metric in original and result.get(metric, 0.0) < original[metric] - args.max_accuracy_drop:
+                    problems.append(f"{name}: {metric} {original[metric]:.3f} -> {result.get(metric, 0.0):.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📝 Results written to {args.json}")
+
+    if problems:
+        print("\n❌ The optimized payloads lost accuracy against the original images:")
+        for problem in problems:
+            print(f"   {problem}")
+        return 1
+    if args.call:
+        print("\n✅ The optimized payloads are as accurate as the original images")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
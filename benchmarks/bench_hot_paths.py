@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Hot path microbenchmarks for NBS - Newtown Bill Splitter App
+Times calculate_totals on synthetic bills (5 x 10 up to 500 members x 5,000 items, at several
+assignment densities) and extract_items_from_text_enhanced on synthetic receipts (20 up to
+20,000 lines). Reports ops/sec, time per unit of input (so quadratic steps stand out) and
+tracemalloc peak/retained memory, and checks speed, memory and a checksum of every result
+against stored baselines. The parser suite also checks a list of known receipt lines.
+
+Usage:
+    python benchmarks/bench_hot_paths.py [--only totals|parser] [--quick] [--json out.json]
+    python benchmarks/bench_hot_paths.py --check            # compare with the stored baselines
+    python benchmarks/bench_hot_paths.py --update-baseline  # store this machine's numbers
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_split_engine import make_bill
+from nbs_billsplitter_app import app, calculate_totals, extract_items_from_text_enhanced
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'hot_paths.json')
+
+TOTALS_SIZES = [(5, 10), (10, 50), (20, 200), (50, 500), (100, 1000), (500, 5000)]
+TOTALS_DENSITIES = [0.1, 0.3, 1.0]
+PARSER_LINES = [20, 200, 2000, 20000]
+QUICK_TOTALS_SIZES = TOTALS_SIZES[:4]
+QUICK_PARSER_LINES = PARSER_LINES[:3]
+
+NOISE_LINES = [
+    'ASDA STORES LTD', 'WWW.ASDA.COM', 'ST. 4696 OP. ScoUser TE. 47 TR. 7099', 'Thank you for shopping',
+    'SUBTOTAL £{price}', 'VAT 20% £{price}', 'CARD £{price}', 'Tel: 01707 123456', '***********',
+    '1.042 kg @ £10.90/kg', 'Table 12  Covers 4', '',
+]
+
+# Receipt lines the parser must read exactly like this, checked whenever the parser suite runs
+PARSER_CASES = [
+    ('Burger 12.99', [{'name': 'Burger', 'price': 12.99}]),
+    ('Fish & Chips 14.5', [{'name': 'Fish & Chips', 'price': 14.5}]),
+    ('Chicken Wings 9 99', [{'name': 'Chicken Wings', 'price': 9.99}]),
+    ('2 Pints 12 50 A', [{'name': 'Pints', 'price': 12.5}]),
+    ('Coffee £3,20', [{'name': 'Coffee', 'price': 3.2}]),
+    ('Steak 25', [{'name': 'Steak', 'price': 25.0}]),
+    ('2 x Burger 12.99', [{'name': 'Burger', 'price': 12.99}]),
+    ('2 x Dish 12  26.40', [{'name': 'Dish 12', 'price': 26.4}]),
+    ('2 Side 3.50 7.00', [{'name': 'Side', 'price': 7.0}]),
+    ('Latte @ 3.10 6.20', [{'name': 'Latte', 'price': 6.2}]),
+    ('Soup - 6.5', [{'name': 'Soup', 'price': 6.5}]),
+    ('Vegetable Curry 11.00', [{'name': 'Vegetable Curry', 'price': 11.0}]),
+    ('SUBTOTAL £42.00', []),
+    ('Taxes 3.00', []),
+    ('Tips 5.00', []),
+    ('Totals 40.00', []),
+    ('Taxable 20.00', []),
+    ('VISA1234 40.00', []),
+    ('Cashier Bob 3', []),
+    ('Tipsy Cake 6.00', [{'name': 'Tipsy Cake', 'price': 6.0}]),
+    ('Tel: 01707 123456', []),
+]
+
+
+def make_receipt(line_count, seed=0):
+    """Synthetic receipt text: mostly item lines in the common layouts, plus headers and totals"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(line_count):
+        price = f'{rng.randint(50, 5000) / 100:.2f}'
+        roll = rng.random()
+        if roll < 0.6:
+            lines.append(f'ITEM {i} NAME £{price}')
+        elif roll < 0.7:
+            lines.append(f'{rng.randint(1, 4)} x DISH {i}  {price}')
+        elif roll < 0.8:
+            lines.append(f'{rng.randint(1, 4)} SIDE {i} {price} {price}')
+        else:
+            lines.append(rng.choice(NOISE_LINES).format(price=price))
+    return '\n'.join(lines)
+
+
+def checksum(result):
+    return hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def measure(func, min_time, max_runs=1000):
+    """Best seconds per call (calling until ``min_time`` has passed), plus one traced call"""
+    best = float('inf')
+    runs = 0
+    start = time.perf_counter()
+    while runs < max_runs and (runs < 3 or time.perf_counter() - start < min_time):
+        call_start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - call_start)
+        runs += 1
+
+    # Memory on a separate call, since tracing slows everything down
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        traced = func()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del traced
+    return {
+        'ops_per_sec': round(1 / best, 2),
+        'best_ms': round(best * 1000, 3),
+        'runs': runs,
+        'peak_kb': round((peak - before) / 1024, 1),
+        'retained_kb': round((after - before) / 1024, 1),
+        'checksum': checksum(result),
+    }
+
+
+def bench_totals(sizes, densities, min_time):
+    cases = {}
+    for member_count, item_count in sizes:
+        for density in densities:
+            members, items = make_bill(member_count, item_count, density)
+            result = measure(lambda: calculate_totals(members, items, 10), min_time)
+            # Per assigned share: the unit of work in the member item lists
+            shares = sum(len(item['assignedTo']) for item in items)
+            result['us_per_share'] = round(result['best_ms'] * 1000 / shares, 3)
+            cases[f'calculate_totals {member_count}x{item_count} d={density:g}'] = result
+    return cases
+
+
+def bench_parser(line_counts, min_time):
+    cases = {}
+    for line_count in line_counts:
+        text = make_receipt(line_count)
+        result = measure(lambda: extract_items_from_text_enhanced(text), min_time)
+        result['us_per_line'] = round(result['best_ms'] * 1000 / line_count, 3)
+        cases[f'extract_items {line_count} lines'] = result
+    return cases
+
+
+def check_parser_cases():
+    """PARSER_CASES lines the parser reads differently, as readable strings"""
+    problems = []
+    for line, expected in PARSER_CASES:
+        found = extract_items_from_text_enhanced(line)
+        if found != expected:
+            problems.append(f"parser: {line!r} gave {found}, expected {expected}")
+    return problems
+
+
+def check(cases, baseline, max_slowdown, max_memory_growth):
+    """Regressions against the baseline, as readable strings"""
+    problems = []
+    for name, result in cases.items():
+        before = baseline.get('cases', {}).get(name)
+        if before is None:
+            continue
+        if result['checksum'] != before['checksum']:
+            problems.append(f"{name}: result changed (checksum {before['checksum']} -> {result['checksum']})")
+        if result['ops_per_sec'] < before['ops_per_sec'] / (1 + max_slowdown):
+            problems.append(f"{name}: {before['ops_per_sec']:.1f} -> {result['ops_per_sec']:.1f} ops/sec")
+        # Small cases allocate a few KB, where noise dominates
+        if before['peak_kb'] >= 64 and result['peak_kb'] > before['peak_kb'] * (1 + max_memory_growth):
+            problems.append(f"{name}: peak memory {before['peak_kb']:.0f} -> {result['peak_kb']:.0f} KB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark calculate_totals and the receipt parser')
+    parser.add_argument('--only', choices=['totals', 'parser'], help='run one suite only')
+    parser.add_argument('--quick', action='store_true', help='skip the largest sizes')
+    parser.add_argument('--python-only', action='store_true',
+                        help='keep calculate_totals on the Python loop (no NumPy engine for large bills)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to spend timing each case')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--check', action='store_true', help='fail if slower, bigger or different than the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='write these results as the baseline')
+    parser.add_argument('--max-slowdown', type=float, default=0.3, help='allowed slowdown (0.3 = 30%%)')
+    parser.add_argument('--max-memory-growth', type=float, default=0.2, help='allowed peak memory growth')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    if args.python_only:
+        app.config['SPLIT_ENGINE_MIN_CELLS'] = float('inf')
+
+    cases = {}
+    problems = []
+    if args.only != 'parser':
+        cases.update(bench_totals(QUICK_TOTALS_SIZES if args.quick else TOTALS_SIZES, TOTALS_DENSITIES, args.min_time))
+    if args.only != 'totals':
+        cases.update(bench_parser(QUICK_PARSER_LINES if args.quick else PARSER_LINES, args.min_time))
+        problems.extend(check_parser_cases())
+
+    print(f"{'case':<40} {'ops/sec':>10} {'best ms':>10} {'per unit us':>12} {'peak KB':>10} {'kept KB':>9}")
+    for name, result in cases.items():
+        per_unit = result.get('us_per_share', result.get('us_per_line'))
+        print(f"{name:<40} {result['ops_per_sec']:>10.1f} {result['best_ms']:>10.3f} {per_unit:>12.3f} "
+              f"{result['peak_kb']:>10.1f} {result['retained_kb']:>9.1f}")
+
+    output = {'python': sys.version.split()[0], 'split_engine_min_cells': app.config['SPLIT_ENGINE_MIN_CELLS'],
+              'cases': cases}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"\n📝 Results written to {args.json}")
+
+    if args.update_baseline:
+        baseline = {'cases': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline['python'] = output['python']
+        baseline['cases'].update(cases)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"📝 Baseline updated: {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"❌ No baseline at {args.baseline}; run with --update-baseline first")
+            return 1
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems.extend(check(cases, baseline, args.max_slowdown, args.max_memory_growth))
+    if problems:
+        print(f"\n❌ {len(problems)} regressions:")
+        for problem in problems:
+            print(f"   {problem}")
+        return 1
+    if args.check:
+        print(f"\n✅ Within {args.max_slowdown:.0%} of the baseline speed and results unchanged")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
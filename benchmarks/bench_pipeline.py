@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark for NBS - Newtown Bill Splitter App
+Runs a directory of receipt images through each Tesseract extraction path, the regex parser and
+calculate_totals, and reports throughput, p50/p95 latency per stage, peak RSS and (with ground
+truth) item-level precision and recall. Results are written as JSON so runs can be compared
+between commits; --compare fails when a path got slower or less accurate than a baseline.
+
+Ground truth is a JSON list of {"sha256": [...], "items": [{"name": ..., "price": ...}]} entries
+(see benchmarks/receipts_truth.json), or a <image name>.json file of items next to each image.
+
+Usage:
+    python benchmarks/bench_pipeline.py [image_dir] [--truth benchmarks/receipts_truth.json]
+        [--modes balanced] [--configs "--oem 3 --psm 6,--oem 3 --psm 11"] [--no-enhanced] [--no-lines]
+        [--repeat 1] [--json out.json] [--compare baseline.json]
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract
+
+from metrics import collect_timings
+from nbs_billsplitter_app import (
+    PREPROCESS_MODES, TESSERACT_CONFIGS, app, calculate_totals, decode_image,
+    extract_items_from_text_enhanced, extract_text_with_tesseract_enhanced, preprocess_image_advanced,
+)
+from ocr_workers import run_tesseract_config
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+STAGES = ('decode', 'preprocess', 'ocr', 'parse', 'calculate_totals', 'total')
+DEFAULT_TRUTH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'receipts_truth.json')
+
+
+def load_corpus(image_dir, keep_duplicates=False):
+    """(name, sha256, raw bytes) for each image; uploads/ holds many copies of the same photo"""
+    corpus = []
+    seen = set()
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(image_dir, name), 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in seen and not keep_duplicates:
+            continue
+        seen.add(digest)
+        corpus.append((name, digest, data))
+    return corpus
+
+
+def load_truth(truth_path, image_dir, corpus):
+    """Map image name -> expected items, from the truth file and/or <image>.json sidecars"""
+    by_sha = {}
+    if truth_path and os.path.exists(truth_path):
+        with open(truth_path) as f:
+            for entry in json.load(f):
+                for digest in entry['sha256']:
+                    by_sha[digest] = entry['items']
+
+    truth = {}
+    for name, digest, _ in corpus:
+        sidecar = os.path.join(image_dir, os.path.splitext(name)[0] + '.json')
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                truth[name] = json.load(f)
+        elif digest in by_sha:
+            truth[name] = by_sha[digest]
+    return truth
+
+
+def tesseract_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def normalise_name(name):
+    return re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+
+
+def match_items(found, expected, name_threshold):
+    """
+    Count found items that match an expected item: same price (to the penny) and a
+    name similarity of at least ``name_threshold``. Each expected item matches once.
+    """
+    unmatched = [(normalise_name(item['name']), round(float(item['price']), 2)) for item in expected]
+    matches = 0
+    for item in found:
+        name, price = normalise_name(item['name']), round(float(item['price']), 2)
+        best, best_score = None, name_threshold
+        for index, (expected_name, expected_price) in enumerate(unmatched):
+            if expected_price != price:
+                continue
+            score = difflib.SequenceMatcher(None, name, expected_name).ratio()
+            if score >= best_score:
+                best, best_score = index, score
+        if best is not None:
+            unmatched.pop(best)
+            matches += 1
+    return matches
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_path(path, image_bytes, members):
+    """Run one receipt through one extraction path; returns (items, seconds per stage)"""
+    timings = {}
+    start = time.perf_counter()
+    image = decode_image(image_bytes)
+    timings['decode'] = time.perf_counter() - start
+    if image is None:
+        raise ValueError('Could not decode image')
+
+    if path['kind'] == 'config':
+        start = time.perf_counter()
+        processed = preprocess_image_advanced(image, mode=path['mode'])
+        timings['preprocess'] = time.perf_counter() - start
+        start = time.perf_counter()
+        text = run_tesseract_config(processed, path['config'])[1]
+        timings['ocr'] = time.perf_counter() - start
+    else:
+        # The app's own extractor preprocesses internally; split the time using its breakdown
+        app.config['TESSERACT_MODE'] = path['tesseract_mode']
+        with collect_timings() as breakdown:
+            start = time.perf_counter()
+            text = extract_text_with_tesseract_enhanced(image)
+            elapsed = time.perf_counter() - start
+        timings['preprocess'] = breakdown.as_milliseconds().get('preprocess', 0.0) / 1000
+        timings['ocr'] = elapsed - timings['preprocess']
+
+    start = time.perf_counter()
+    items = extract_items_from_text_enhanced(text)
+    timings['parse'] = time.perf_counter() - start
+
+    for item in items:
+        item['assignedTo'] = list(members)
+    start = time.perf_counter()
+    calculate_totals(members, items)
+    timings['calculate_totals'] = time.perf_counter() - start
+
+    timings['total'] = sum(timings.values())
+    return items, timings
+
+
+def benchmark_path(path, corpus, truth, members, repeat, name_threshold):
+    samples = {stage: [] for stage in STAGES}
+    found = expected = matched = 0
+    items_found = errors = 0
+    for name, _, image_bytes in corpus:
+        for run in range(repeat):
+            try:
+                items, timings = run_path(path, image_bytes, members)
+            except Exception as e:
+                print(f"⚠️  {path['name']} failed on {name}: {e}")
+                errors += 1
+                continue
+            for stage in STAGES:
+                samples[stage].append(timings[stage])
+            # Accuracy is the same on every repeat, so score the first run only
+            if run == 0:
+                items_found += len(items)
+                if name in truth:
+                    found += len(items)
+                    expected += len(truth[name])
+                    matched += match_items(items, truth[name], name_threshold)
+
+    total_seconds = sum(samples['total'])
+    result = {
+        'receipts': len(samples['total']),
+        'errors': errors,
+        'receipts_per_sec': round(len(samples['total']) / total_seconds, 3) if total_seconds else 0.0,
+        'stages': {
+            stage: {
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+            }
+            for stage, values in samples.items() if values
+        },
+        'items_found': items_found,
+    }
+    if expected:
+        result['precision'] = round(matched / found, 4) if found else 0.0
+        result['recall'] = round(matched / expected, 4)
+    return result
+
+
+def compare(results, baseline, max_slowdown, max_accuracy_drop):
+    """Regressions of each path against a baseline run, as readable strings"""
+    problems = []
+    for name, result in results['paths'].items():
+        before = baseline.get('paths', {}).get(name)
+        if not before or 'total' not in result['stages'] or 'total' not in before.get('stages', {}):
+            continue
+        old, new = before['stages']['total']['p95_ms'], result['stages']['total']['p95_ms']
+        if old and new > old * (1 + max_slowdown):
+            problems.append(f"{name}: p95 {old:.1f}ms -> {new:.1f}ms (+{(new / old - 1) * 100:.0f}%)")
+        for metric in ('precision', 'recall'):
+            if metric in before and metric in result and result[metric] < before[metric] - max_accuracy_drop:
+                problems.append(f"{name}: {metric} {before[metric]:.3f} -> {result[metric]:.3f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction pipeline on a receipt corpus')
+    parser.add_argument('image_dir', nargs='?', default='uploads')
+    parser.add_argument('--truth', default=DEFAULT_TRUTH, help='ground truth JSON (default: %(default)s)')
+    parser.add_argument('--modes', default=app.config['PREPROCESS_MODE'],
+                        help=f"preprocessing tiers to combine with each config ({', '.join(PREPROCESS_MODES)})")
+    parser.add_argument('--configs', default=','.join(TESSERACT_CONFIGS), help='comma-separated Tesseract configs')
+    parser.add_argument('--no-enhanced', action='store_true', help="skip the app's parallel Tesseract extractor")
+    parser.add_argument('--no-lines', action='store_true', help="skip the app's line-by-line Tesseract extractor")
+    parser.add_argument('--members', type=int, default=4, help='group size for the calculate_totals stage')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per image')
+    parser.add_argument('--keep-duplicates', action='store_true', help='benchmark identical images more than once')
+    parser.add_argument('--name-threshold', type=float, default=0.6,
+                        help='minimum name similarity (0-1) for a found item to count as correct')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results JSON to check for regressions')
+    parser.add_argument('--max-slowdown', type=float, default=0.2, help='allowed p95 increase (0.2 = 20%%)')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.05, help='allowed precision/recall drop')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.image_dir, args.keep_duplicates)
+    if not corpus:
+        print(f"❌ No images found in {args.image_dir}")
+        return 1
+    if not tesseract_available():
+        print("❌ Tesseract not found; install it to benchmark the extraction paths")
+        return 1
+    truth = load_truth(args.truth, args.image_dir, corpus)
+    members = [f'Member {number + 1}' for number in range(args.members)]
+
+    paths = [
+        {'name': f'{mode} | {config}', 'kind': 'config', 'mode': mode, 'config': config}
+        for mode in (mode.strip() for mode in args.modes.split(',') if mode.strip())
+        for config in (config.strip() for config in args.configs.split(',') if config.strip())
+    ]
+    if not args.no_enhanced:
+        paths.append({'name': 'tesseract_enhanced', 'kind': 'enhanced', 'tesseract_mode': 'page'})
+    if not args.no_lines:
+        paths.append({'name': 'tesseract_lines', 'kind': 'enhanced', 'tesseract_mode': 'lines'})
+
+    print(f"🧾 {len(corpus)} images ({len(truth)} with ground truth), {len(paths)} paths")
+    results = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'images': len(corpus),
+        'images_with_truth': len(truth),
+        'repeat': args.repeat,
+        'paths': {},
+    }
+    for path in paths:
+        print(f"⏱️  {path['name']}")
+        results['paths'][path['name']] = benchmark_path(path, corpus, truth, members, args.repeat, args.name_threshold)
+    results['peak_rss_mb'] = peak_rss_mb(resource.RUSAGE_SELF)
+    # Tesseract runs as a subprocess (and the enhanced extractor in a process pool)
+    results['peak_children_rss_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    print(f"\n{'path':<34} {'rcpt/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'items':>6} {'prec':>6} {'recall':>6}")
+    for name, result in results['paths'].items():
+        total = result['stages'].get('total', {'p50_ms': 0.0, 'p95_ms': 0.0})
+        precision = f"{result['precision']:.2f}" if 'precision' in result else '-'
+        recall = f"{result['recall']:.2f}" if 'recall' in result else '-'
+        print(f"{name:<34} {result['receipts_per_sec']:>7.2f} {total['p50_ms']:>9.1f} {total['p95_ms']:>9.1f} "
+              f"{result['items_found']:>6} {precision:>6} {recall:>6}")
+        stages = ', '.join(f"{stage} {timing['p50_ms']:.1f}/{timing['p95_ms']:.1f}"
+                           for stage, timing in result['stages'].items() if stage != 'total')
+        print(f"{'':<34} p50/p95 ms: {stages}")
+    print(f"\nPeak RSS: {results['peak_rss_mb']} MB (children {results['peak_children_rss_mb']} MB)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📝 Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.max_slowdown, args.max_accuracy_drop)
+        if problems:
+            print(f"\n❌ Regressions against {args.compare} ({baseline.get('commit') or 'unknown commit'}):")
+            for problem in problems:
+                print(f"   {problem}")
+            return 1
+        print(f"\n✅ No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Preprocessing benchmark for NBS - Newtown Bill Splitter App
+Compares the speed of each preprocessing tier and, when Tesseract is installed, how much OCR
+accuracy it gives up against the full-quality tier.
+
+Usage:
+    python benchmarks/bench_preprocess.py [image_dir] [--modes fast,balanced,quality] [--repeat 3] [--json out.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract
+
+from nbs_billsplitter_app import PREPROCESS_MODES, decode_image, extract_items_from_text_enhanced, preprocess_image_advanced
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def load_corpus(image_dir):
+    """Decode each distinct image in the directory once (uploads/ holds many duplicates)"""
+    corpus = []
+    seen = set()
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(image_dir, name), 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        image = decode_image(data)
+        if image is not None:
+            corpus.append((name, image))
+    return corpus
+
+
+def tesseract_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def word_f1(text, reference):
+    """Bag-of-words F1 between OCR output and the reference text"""
+    words, expected = Counter(text.lower().split()), Counter(reference.lower().split())
+    common = sum((words & expected).values())
+    if not common:
+        return 0.0
+    precision = common / sum(words.values())
+    recall = common / sum(expected.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the preprocessing tiers')
+    parser.add_argument('image_dir', nargs='?', default='uploads')
+    parser.add_argument('--modes', default=','.join(PREPROCESS_MODES))
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs per image')
+    parser.add_argument('--no-ocr', action='store_true', help='skip the OCR accuracy comparison')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    corpus = load_corpus(args.image_dir)
+    if not corpus:
+        print(f"❌ No images found in {args.image_dir}")
+        return 1
+    run_ocr = not args.no_ocr and tesseract_available()
+    if not args.no_ocr and not run_ocr:
+        print("⚠️  Tesseract not found, reporting speed only")
+
+    print(f"🧾 {len(corpus)} distinct images, modes: {', '.join(modes)}")
+    results = {}
+    texts = {}
+    for mode in modes:
+        stage_totals = Counter()
+        durations = []
+        megapixels = 0.0
+        for name, image in corpus:
+            for _ in range(args.repeat):
+                timings = {}
+                start = time.perf_counter()
+                processed = preprocess_image_advanced(image, mode=mode, timings=timings)
+                durations.append(time.perf_counter() - start)
+                stage_totals.update(timings)
+                megapixels += image.shape[0] * image.shape[1] / 1e6
+            if run_ocr:
+                texts[(mode, name)] = pytesseract.image_to_string(processed, config='--oem 3 --psm 6')
+
+        runs = len(durations)
+        results[mode] = {
+            'images_per_sec': runs / sum(durations),
+            'megapixels_per_sec': megapixels / sum(durations),
+            'mean_ms': statistics.mean(durations) * 1000,
+            'stage_ms': {stage: seconds / runs * 1000 for stage, seconds in stage_totals.items()},
+        }
+
+    if run_ocr:
+        reference_mode = 'quality' if 'quality' in modes else modes[-1]
+        for mode in modes:
+            scores = [word_f1(texts[(mode, name)], texts[(reference_mode, name)]) for name, _ in corpus]
+            items = [len(extract_items_from_text_enhanced(texts[(mode, name)])) for name, _ in corpus]
+            results[mode]['word_f1_vs_' + reference_mode] = statistics.mean(scores)
+            results[mode]['items_found'] = sum(items)
+
+    print(f"\n{'mode':<10} {'img/s':>8} {'MP/s':>8} {'mean ms':>9}  stages (ms)")
+    for mode, result in results.items():
+        stages = ', '.join(f"{stage} {ms:.1f}" for stage, ms in result['stage_ms'].items())
+        print(f"{mode:<10} {result['images_per_sec']:>8.2f} {result['megapixels_per_sec']:>8.1f} "
+              f"{result['mean_ms']:>9.1f}  {stages}")
+        if run_ocr:
+            f1_key = next(key for key in result if key.startswith('word_f1_vs_'))
+            print(f"{'':<10} {f1_key}: {result[f1_key]:.3f}, items found: {result['items_found']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'images': len(corpus), 'ocr': run_ocr, 'modes': results}, f, indent=2)
+        print(f"\n📝 Results written to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
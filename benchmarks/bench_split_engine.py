@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Split engine benchmark for NBS - Newtown Bill Splitter App
+Times the Python calculate_totals loop against the vectorised split engine on synthetic bills
+and checks that both return the same result, on those bills and on --random irregular ones.
+
+Usage:
+    python benchmarks/bench_split_engine.py [--sizes 5x10,50x500,500x5000] [--density 0.3]
+        [--random 300] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nbs_billsplitter_app import app, calculate_totals
+from split_engine import calculate_totals_vectorized
+
+DEFAULT_SIZES = '5x10,10x50,20x200,50x500,100x1000,500x5000'
+
+
+def make_bill(member_count, item_count, density, seed=0):
+    """Synthetic bill; each member shares each item with probability ``density``"""
+    rng = random.Random(seed)
+    members = [f'Member {i}' for i in range(member_count)]
+    items = []
+    for i in range(item_count):
+        assigned = [member for member in members if rng.random() < density] or [rng.choice(members)]
+        items.append({'name': f'Item {i}', 'price': rng.randint(50, 5000) / 100, 'assignedTo': assigned})
+    return members, items
+
+
+def make_random_bill(seed):
+    """
+    Irregular bill: odd prices, unassigned items (empty or null assignedTo),
+    names outside the member list and members listed twice
+    """
+    rng = random.Random(seed)
+    members = [f'Member {i}' for i in range(rng.randint(1, 30))]
+    items = []
+    for i in range(rng.randint(1, 300)):
+        roll = rng.random()
+        if roll < 0.05:
+            assigned = None
+        else:
+            assigned = [member for member in members if rng.random() < 0.3]
+            if roll > 0.95:
+                assigned += ['Guest', rng.choice(members)]
+        price = rng.choice([rng.randint(1, 9999) / 100, rng.randint(1, 999) / 10, rng.randint(0, 50)])
+        items.append({'name': f'Item {i}', 'price': price, 'assignedTo': assigned})
+    discount = rng.choice([0, 5, 10, 12.5, 15, round(rng.uniform(0, 50), 2)])
+    return members, items, discount
+
+
+def check_random_bills(count):
+    """Seeds of random bills where the two engines disagree"""
+    mismatches = []
+    for seed in range(count):
+        members, items, discount = make_random_bill(seed)
+        identical, _ = compare(calculate_totals(members, items, discount),
+                               calculate_totals_vectorized(members, items, discount))
+        if not identical:
+            mismatches.append(seed)
+    return mismatches
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def compare(expected, actual):
+    """Return (identical JSON, largest difference in any rounded amount)"""
+    if json.dumps(expected, sort_keys=True) == json.dumps(actual, sort_keys=True):
+        return True, 0.0
+    worst = max(abs(expected[key] - actual[key]) for key in ('subtotal', 'discount_amount', 'final_total'))
+    for member, data in expected['member_totals'].items():
+        other = actual['member_totals'][member]
+        worst = max([worst] + [abs(data[key] - other[key]) for key in ('total', 'discount', 'final_total')])
+    return False, worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark calculate_totals against the vectorised engine')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated MEMBERSxITEMS')
+    parser.add_argument('--density', type=float, default=0.3, help='chance a member shares an item')
+    parser.add_argument('--discount', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--random', type=int, default=300, help='random bills to check for identical results')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    # Force calculate_totals onto the Python loop for the comparison
+    app.config['SPLIT_ENGINE_MIN_CELLS'] = float('inf')
+
+    results = []
+    print(f"{'members x items':>16} {'python ms':>10} {'numpy ms':>10} {'speedup':>8}  identical")
+    for size in args.sizes.split(','):
+        member_count, item_count = (int(part) for part in size.lower().split('x'))
+        members, items = make_bill(member_count, item_count, args.density)
+
+        python_time, expected = best_time(lambda: calculate_totals(members, items, args.discount), args.repeat)
+        numpy_time, actual = best_time(lambda: calculate_totals_vectorized(members, items, args.discount), args.repeat)
+        identical, worst = compare(expected, actual)
+
+        results.append({
+            'members': member_count,
+            'items': item_count,
+            'python_ms': python_time * 1000,
+            'numpy_ms': numpy_time * 1000,
+            'speedup': python_time / numpy_time,
+            'identical': identical,
+            'max_difference': worst,
+        })
+        note = 'yes' if identical else f'no (max difference {worst:.2f})'
+        print(f"{size:>16} {python_time * 1000:>10.2f} {numpy_time * 1000:>10.2f} "
+              f"{python_time / numpy_time:>7.1f}x  {note}")
+
+    mismatches = check_random_bills(args.random)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'density': args.density, 'discount': args.discount, 'results': results,
+                       'random_bills': args.random, 'random_mismatches': mismatches}, f, indent=2)
+        print(f"\n📝 Results written to {args.json}")
+
+    if mismatches or not all(result['identical'] for result in results):
+        print(f"\n❌ The engines disagree (random bill seeds: {mismatches[:10]})")
+        return 1
+    print(f"\n✅ Identical results on every size and on {args.random} random bills")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Bill history for NBS - Newtown Bill Splitter App
+Saved bills with their items, assignments and member totals, plus running per-member balances.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from member_store import DEFAULT_GROUP, connect_database
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def to_cents(amount: Any) -> int:
+    return int(round(float(amount) * 100))
+
+
+class BillHistory:
+    """
+    Saved bills, queryable by group, member and date.
+
+    Each group keeps a running balance per member (what they paid minus what
+    their shares came to), updated in the same transaction that saves or
+    deletes a bill, so reading balances never rescans the bills. Amounts are
+    stored as whole cents so the running sums do not drift.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = connect_database(path)
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[Optional[str], Optional[Dict[str, int]]], None]] = []
+        self._data_version: Optional[int] = None
+        self._create_schema()
+        self.check_external_changes()
+
+    def add_listener(self, listener: Callable[[Optional[str], Optional[Dict[str, int]]], None]):
+        """
+        Call ``listener(group, {member: balance change in cents})`` after each
+        saved or deleted bill, and ``listener(None, None)`` when another
+        process has changed the database (so anything derived may be stale).
+        """
+        self._listeners.append(listener)
+
+    def reconnect(self):
+        """Open a fresh connection; call in a forked child, which must not share the parent's"""
+        with self._lock:
+            self._db = connect_database(self.path)
+            self._data_version = None
+        self._notify(None, None)
+
+    def check_external_changes(self):
+        """Tell the listeners if another connection has committed since we last looked"""
+        with self._lock:
+            version = self._db.execute('PRAGMA data_version').fetchone()[0]
+            changed = self._data_version is not None and version != self._data_version
+            self._data_version = version
+        if changed:
+            self._notify(None, None)
+
+    def add_bill(self, items: List[Dict[str, Any]], totals: Dict[str, Any],
+                 group: str = DEFAULT_GROUP, paid_by: Any = None, title: str = '',
+                 created: Optional[float] = None) -> Tuple[int, Dict[str, int]]:
+        """
+        Save a bill with its calculate_totals result.
+
+        ``paid_by`` is the member who paid (credited with every member's
+        share), a {member: amount} dict for a split payment, or None.
+        Returns (bill id, {member: balance change in cents}).
+        """
+        owed = {member: to_cents(data['final_total']) for member, data in totals['member_totals'].items()}
+        paid = paid_amounts(paid_by, sum(owed.values()))
+        changes = {member: paid.get(member, 0) - owed.get(member, 0) for member in {**owed, **paid}}
+        created = time.time() if created is None else created
+
+        with self._lock:
+            with self._transaction():
+                bill_id = self._db.execute(
+                    'INSERT INTO bills (group_name, created, title, paid_by, subtotal, discount_percent, '
+                    'discount_amount, final_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (group, created, title, ', '.join(paid), to_cents(totals['subtotal']),
+                     totals['discount_percent'], to_cents(totals['discount_amount']), to_cents(totals['final_total']))
+                ).lastrowid
+                self._db.executemany(
+                    'INSERT INTO bill_items (bill_id, position, name, price) VALUES (?, ?, ?, ?)',
+                    [(bill_id, position, item['name'], to_cents(item['price'])) for position, item in enumerate(items)]
+                )
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO assignments (bill_id, position, member) VALUES (?, ?, ?)',
+                    [(bill_id, position, member) for position, item in enumerate(items)
+                     for member in item.get('assignedTo', [])]
+                )
+                self._db.executemany(
+                    'INSERT INTO member_totals (bill_id, group_name, created, member, total, discount, final_total, paid) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(bill_id, group, created, member, to_cents(data['total']), to_cents(data['discount']), owed[member],
+                      paid.get(member, 0)) for member, data in totals['member_totals'].items()]
+                    + [(bill_id, group, created, member, 0, 0, 0, amount)
+                       for member, amount in paid.items() if member not in owed]
+                )
+                self._add_to_balances(group, owed, paid, sign=1)
+            self._notify(group, changes)
+        return bill_id, changes
+
+    def delete_bill(self, bill_id: int) -> Optional[Tuple[str, Dict[str, int]]]:
+        """Delete a bill and take it out of the balances; returns (group, changes) or None if unknown"""
+        with self._lock:
+            with self._transaction():
+                row = self._db.execute('SELECT group_name FROM bills WHERE id = ?', (bill_id,)).fetchone()
+                if row is None:
+                    return None
+                rows = self._db.execute(
+                    'SELECT member, final_total, paid FROM member_totals WHERE bill_id = ?', (bill_id,)
+                ).fetchall()
+                owed = {r['member']: r['final_total'] for r in rows}
+                paid = {r['member']: r['paid'] for r in rows}
+                self._add_to_balances(row['group_name'], owed, paid, sign=-1)
+                self._db.execute('DELETE FROM bills WHERE id = ?', (bill_id,))
+                self._db.execute('DELETE FROM balances WHERE group_name = ? AND bill_count <= 0', (row['group_name'],))
+            changes = {member: owed[member] - paid[member] for member in owed}
+            self._notify(row['group_name'], changes)
+        return row['group_name'], changes
+
+    def get_bill(self, bill_id: int) -> Optional[Dict[str, Any]]:
+        """A saved bill with its items (and who they were assigned to) and member totals"""
+        with self._lock:
+            row = self._db.execute('SELECT * FROM bills WHERE id = ?', (bill_id,)).fetchone()
+            if row is None:
+                return None
+            bill = bill_summary(row)
+            items = self._db.execute(
+                'SELECT position, name, price FROM bill_items WHERE bill_id = ? ORDER BY position', (bill_id,)
+            ).fetchall()
+            assigned: Dict[int, List[str]] = {}
+            for r in self._db.execute(
+                    'SELECT position, member FROM assignments WHERE bill_id = ? ORDER BY rowid', (bill_id,)):
+                assigned.setdefault(r['position'], []).append(r['member'])
+            bill['items'] = [{'name': r['name'], 'price': r['price'] / 100, 'assignedTo': assigned.get(r['position'], [])}
+                             for r in items]
+            bill['member_totals'] = {
+                r['member']: {'total': r['total'] / 100, 'discount': r['discount'] / 100,
+                              'final_total': r['final_total'] / 100, 'paid': r['paid'] / 100}
+                for r in self._db.execute('SELECT * FROM member_totals WHERE bill_id = ?', (bill_id,))
+            }
+            return bill
+
+    def list_bills(self, group: Optional[str] = None, member: Optional[str] = None,
+                   since: Optional[float] = None, until: Optional[float] = None,
+                   limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of bills, newest first, optionally only a group's, a member's
+        or those between ``since`` and ``until``. Pass the returned
+        ``next_cursor`` to get the next page; paging by (created, id) instead
+        of an offset keeps deep pages as fast as the first.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        # A member's bills are found through member_totals, which carries the group and date
+        # so that its index alone gives the page in order
+        if member is not None:
+            source, key = 'member_totals t JOIN bills b ON b.id = t.bill_id', 't.bill_id'
+            conditions, params = ['t.member = ?'], [member]
+            table = 't'
+        else:
+            source, key = 'bills b', 'b.id'
+            conditions, params = [], []
+            table = 'b'
+        if group is not None:
+            conditions.append(f'{table}.group_name = ?')
+            params.append(group)
+        if since is not None:
+            conditions.append(f'{table}.created >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append(f'{table}.created < ?')
+            params.append(until)
+        if cursor:
+            created, bill_id = parse_cursor(cursor)
+            conditions.append(f'({table}.created, {key}) < (?, ?)')
+            params.extend([created, bill_id])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT b.* FROM {source} {where} ORDER BY {table}.created DESC, {key} DESC LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+        bills = [bill_summary(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last['created']!r}:{last['id']}"
+        return {'bills': bills, 'next_cursor': next_cursor}
+
+    def balances(self, group: str = DEFAULT_GROUP) -> Dict[str, Dict[str, Any]]:
+        """Running totals per member of a group: paid, owed, balance (paid - owed) and bill count"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT member, paid, owed, bill_count FROM balances WHERE group_name = ? ORDER BY member', (group,)
+            ).fetchall()
+        return {r['member']: {'paid': r['paid'] / 100, 'owed': r['owed'] / 100,
+                              'balance': (r['paid'] - r['owed']) / 100, 'bills': r['bill_count']}
+                for r in rows}
+
+    def balance_cents(self, group: str = DEFAULT_GROUP) -> Dict[str, int]:
+        """Each member's balance (paid - owed) in cents"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT member, paid - owed AS balance FROM balances WHERE group_name = ?', (group,)
+            ).fetchall()
+        return {r['member']: r['balance'] for r in rows}
+
+    def _add_to_balances(self, group: str, owed: Dict[str, int], paid: Dict[str, int], sign: int):
+        """Add (sign=1) or take away (sign=-1) one bill's amounts from the group's running balances"""
+        self._db.executemany(
+            'INSERT INTO balances (group_name, member, paid, owed, bill_count) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(group_name, member) DO UPDATE SET paid = paid + excluded.paid, '
+            'owed = owed + excluded.owed, bill_count = bill_count + excluded.bill_count',
+            [(group, member, sign * paid.get(member, 0), sign * owed.get(member, 0), sign)
+             for member in {**owed, **paid}]
+        )
+
+    def _notify(self, group: Optional[str], changes: Optional[Dict[str, int]]):
+        for listener in self._listeners:
+            try:
+                listener(group, changes)
+            except Exception as e:
+                print(f"Bill history listener failed: {e}")
+
+    def _transaction(self):
+        # Runs under self._lock; other processes' commits are noticed before ours is applied
+        self.check_external_changes()
+        return _Transaction(self._db)
+
+    def _create_schema(self):
+        with self._lock:
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS bills (
+                    id INTEGER PRIMARY KEY,
+                    group_name TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    title TEXT NOT NULL DEFAULT '',
+                    paid_by TEXT NOT NULL DEFAULT '',
+                    subtotal INTEGER NOT NULL,
+                    discount_percent REAL NOT NULL,
+                    discount_amount INTEGER NOT NULL,
+                    final_total INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS bills_by_group_date ON bills (group_name, created, id);
+                CREATE INDEX IF NOT EXISTS bills_by_date ON bills (created, id);
+                CREATE TABLE IF NOT EXISTS bill_items (
+                    bill_id INTEGER NOT NULL REFERENCES bills(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    price INTEGER NOT NULL,
+                    PRIMARY KEY (bill_id, position)
+                );
+                CREATE TABLE IF NOT EXISTS assignments (
+                    bill_id INTEGER NOT NULL REFERENCES bills(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    member TEXT NOT NULL,
+                    PRIMARY KEY (bill_id, position, member)
+                );
+                CREATE TABLE IF NOT EXISTS member_totals (
+                    bill_id INTEGER NOT NULL REFERENCES bills(id) ON DELETE CASCADE,
+                    group_name TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    member TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    discount INTEGER NOT NULL,
+                    final_total INTEGER NOT NULL,
+                    paid INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bill_id, member)
+                );
+                CREATE INDEX IF NOT EXISTS member_totals_by_member ON member_totals (member, created, bill_id);
+                CREATE INDEX IF NOT EXISTS member_totals_by_member_group
+                    ON member_totals (member, group_name, created, bill_id);
+                CREATE TABLE IF NOT EXISTS balances (
+                    group_name TEXT NOT NULL,
+                    member TEXT NOT NULL,
+                    paid INTEGER NOT NULL DEFAULT 0,
+                    owed INTEGER NOT NULL DEFAULT 0,
+                    bill_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (group_name, member)
+                );
+            ''')
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, or ROLLBACK if the block raised"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def paid_amounts(paid_by: Any, owed_cents: int) -> Dict[str, int]:
+    """
+    Cents paid per member: one payer covers every member's share,
+    a {member: amount} dict is taken as given. Raises ValueError otherwise.
+    """
+    if paid_by is None or paid_by == '':
+        return {}
+    if isinstance(paid_by, str):
+        return {paid_by: owed_cents}
+    if isinstance(paid_by, dict):
+        return {str(member): to_cents(amount) for member, amount in paid_by.items() if to_cents(amount)}
+    raise ValueError('paid_by must be a member name or a {member: amount} object')
+
+
+def bill_summary(row) -> Dict[str, Any]:
+    return {
+        'id': row['id'],
+        'group': row['group_name'],
+        'created': row['created'],
+        'title': row['title'],
+        'paid_by': row['paid_by'],
+        'subtotal': row['subtotal'] / 100,
+        'discount_percent': row['discount_percent'],
+        'discount_amount': row['discount_amount'] / 100,
+        'final_total': row['final_total'] / 100,
+    }
+
+
+def parse_cursor(cursor: str) -> Tuple[float, int]:
+    """Split a next_cursor value; raises ValueError for a malformed one"""
+    created, _, bill_id = cursor.partition(':')
+    return float(created), int(bill_id)
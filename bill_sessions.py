@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Server-side bill sessions for NBS - Newtown Bill Splitter App
+Keeps per-member totals so each click only recomputes the members it touches.
+"""
+
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class BillSession:
+    """
+    A bill whose totals are updated incrementally.
+
+    Each delta recomputes only the members sharing the changed item (a
+    discount change touches everyone). A member is recomputed from their own
+    items with the same float operations, in the same order, as
+    calculate_totals, so the figures match it to the cent, half-cent ties
+    included (checked by benchmarks/bench_bill_sessions.py).
+    """
+
+    def __init__(self, members: List[str], items: List[Dict[str, Any]], discount_percent: float = 0):
+        self.id = uuid.uuid4().hex
+        self.version = 0
+        self.updated = time.time()
+        self.lock = threading.Lock()
+        self.members: List[str] = list(dict.fromkeys(members))
+        self._member_set = set(self.members)
+        self.discount_percent = discount_percent
+        self.subtotal = 0
+        self.items: List[Dict[str, Any]] = []
+        # member -> indices of the items they share, and their total as calculate_totals adds it up
+        self.member_items: Dict[str, Set[int]] = {member: set() for member in self.members}
+        self.member_totals: Dict[str, float] = {member: 0 for member in self.members}
+        for item in items:
+            self._add_item(item['name'], item['price'], item.get('assignedTo') or [])
+
+    def apply(self, deltas: Iterable[Dict[str, Any]]) -> Set[str]:
+        """
+        Apply a list of deltas and return the members whose totals changed.
+
+        Supported deltas:
+            {"op": "toggle", "item": 0, "member": "Sam"}
+            {"op": "set_price", "item": 0, "price": 12.5}
+            {"op": "set_discount", "discount": 10}
+            {"op": "add_item", "name": "Chips", "price": 3.5, "assignedTo": ["Sam"]}
+        The whole list is checked first: it raises ValueError for an unknown op,
+        item or member or a bad value, and then none of the deltas is applied.
+        """
+        changes = self._check(deltas)
+        before = {member: self._discounted(member) for member in self.members}
+        changed: Set[str] = set()
+        for op, *args in changes:
+            if op == 'toggle':
+                changed |= self._toggle(*args)
+            elif op == 'set_price':
+                changed |= self._reprice(*args)
+            elif op == 'set_discount':
+                self.discount_percent = args[0]
+                changed |= self._member_set
+            else:
+                changed |= self._add_item(*args)
+        # A new subtotal can move another member's discount by a rounding step
+        changed.update(member for member in self.members
+                       if member not in changed and self._discounted(member) != before[member])
+        self.version += 1
+        self.updated = time.time()
+        return changed
+
+    def summary(self) -> Dict[str, Any]:
+        """Bill-level totals, in the calculate_totals format"""
+        discount_amount = (self.subtotal * self.discount_percent) / 100
+        return {
+            'subtotal': round(self.subtotal, 2),
+            'discount_percent': self.discount_percent,
+            'discount_amount': round(discount_amount, 2),
+            'final_total': round(self.subtotal - discount_amount, 2),
+        }
+
+    def member_total(self, member: str) -> Dict[str, Any]:
+        """One member's entry of calculate_totals' member_totals"""
+        discount, final_total = self._discounted(member)
+        return {
+            'total': round(self.member_totals[member], 2),
+            'discount': discount,
+            'final_total': final_total,
+            'items': [
+                {
+                    'name': self.items[index]['name'],
+                    'price': self.items[index]['price'] / len(self.items[index]['assignedTo']),
+                    'shared_with': len(self.items[index]['assignedTo'])
+                }
+                for index in sorted(self.member_items[member])
+                for _ in range(self.items[index]['assignedTo'].count(member))
+            ]
+        }
+
+    def totals(self, members: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Summary plus member totals (all members, or only the ones given, in bill order)"""
+        wanted = self._member_set if members is None else set(members)
+        result = self.summary()
+        result['member_totals'] = {member: self.member_total(member) for member in self.members if member in wanted}
+        return result
+
+    def _check(self, deltas: Iterable[Dict[str, Any]]) -> List[tuple]:
+        """Validate every delta, in order, and return them as (op, *arguments) tuples"""
+        changes = []
+        item_count = len(self.items)
+        for delta in deltas:
+            if not isinstance(delta, dict):
+                raise ValueError('Each delta must be an object')
+            op = delta.get('op')
+            if op == 'toggle':
+                changes.append((op, self._item_index(delta, item_count), self._member(delta.get('member'))))
+            elif op == 'set_price':
+                changes.append((op, self._item_index(delta, item_count), self._number(delta, 'price')))
+            elif op == 'set_discount':
+                changes.append((op, self._number(delta, 'discount')))
+            elif op == 'add_item':
+                name = delta.get('name')
+                assigned_to = delta.get('assignedTo') or []
+                if not isinstance(name, str) or not name:
+                    raise ValueError('add_item needs a name')
+                if not isinstance(assigned_to, list) or not all(isinstance(member, str) for member in assigned_to):
+                    raise ValueError('assignedTo must be a list of names')
+                changes.append((op, name, self._number(delta, 'price'), assigned_to))
+                item_count += 1
+            else:
+                raise ValueError(f'Unknown delta op: {op}')
+        return changes
+
+    @staticmethod
+    def _item_index(delta: Dict[str, Any], item_count: int) -> int:
+        index = delta.get('item')
+        if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < item_count:
+            raise ValueError(f'Unknown item: {index}')
+        return index
+
+    def _member(self, member: Any) -> str:
+        if not isinstance(member, str) or member not in self._member_set:
+            raise ValueError(f'Unknown member: {member}')
+        return member
+
+    @staticmethod
+    def _number(delta: Dict[str, Any], key: str) -> float:
+        try:
+            value = float(delta[key])
+        except (KeyError, TypeError, ValueError):
+            value = math.nan
+        # NaN or infinity would make every total that includes it meaningless
+        if not math.isfinite(value * 100):
+            raise ValueError(f'{key} must be a number')
+        return value
+
+    def _add_item(self, name: str, price: Any, assigned_to: List[str]) -> Set[str]:
+        price = float(price)
+        self.items.append({'name': name, 'price': price, 'assignedTo': list(assigned_to)})
+        # The new item is last, so adding it on is exactly the next step of calculate_totals' loop
+        self.subtotal += price
+        index = len(self.items) - 1
+        changed = set()
+        if assigned_to:
+            price_per_person = price / len(assigned_to)
+            for member in assigned_to:
+                if member in self._member_set:
+                    self.member_items[member].add(index)
+                    self.member_totals[member] += price_per_person
+                    changed.add(member)
+        return changed
+
+    def _toggle(self, index: int, member: str) -> Set[str]:
+        assigned = self.items[index]['assignedTo']
+        before = set(assigned)
+        if member in assigned:
+            assigned.remove(member)
+        else:
+            assigned.append(member)
+        # Everyone still listed gets a different share of the item
+        return self._reassign(index, before, assigned)
+
+    def _reprice(self, index: int, price: float) -> Set[str]:
+        self.items[index]['price'] = price
+        # A float sum cannot be patched in place and stay identical, so add the prices up again
+        subtotal = 0
+        for item in self.items:
+            subtotal += item['price']
+        self.subtotal = subtotal
+        assigned = self.items[index]['assignedTo']
+        return self._reassign(index, set(assigned), assigned)
+
+    def _reassign(self, index: int, before: Iterable[str], after: Iterable[str]) -> Set[str]:
+        """Update who shares item ``index`` and recompute everyone who shared it before or after"""
+        changed = {member for member in set(before) | set(after) if member in self._member_set}
+        for member in changed:
+            if member in after:
+                self.member_items[member].add(index)
+            else:
+                self.member_items[member].discard(index)
+            self.member_totals[member] = self._member_sum(member)
+        return changed
+
+    def _member_sum(self, member: str) -> float:
+        """A member's total, added up like calculate_totals: their shares in item order"""
+        total = 0
+        for index in sorted(self.member_items[member]):
+            item = self.items[index]
+            assigned = item['assignedTo']
+            price_per_person = item['price'] / len(assigned)
+            for _ in range(assigned.count(member)):
+                total += price_per_person
+        return total
+
+    def _discounted(self, member: str) -> Tuple[float, float]:
+        """A member's rounded (discount, final_total), as calculate_totals applies the discount"""
+        total = self.member_totals[member]
+        if total <= 0 or not self.subtotal:
+            return 0, 0
+        discount_amount = (self.subtotal * self.discount_percent) / 100
+        member_discount = (total / self.subtotal) * discount_amount
+        return round(member_discount, 2), round(total - member_discount, 2)
+
+
+class BillSessionStore:
+    """In-memory sessions, dropped after ``ttl`` seconds idle or beyond ``max_sessions``"""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 6 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: 'OrderedDict[str, BillSession]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, members: List[str], items: List[Dict[str, Any]], discount_percent: float = 0) -> BillSession:
+        session = BillSession(members, items, discount_percent)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, bill_id: str) -> Optional[BillSession]:
+        with self._lock:
+            session = self._sessions.get(bill_id)
+            if session is None or time.time() - session.updated > self.ttl:
+                self._sessions.pop(bill_id, None)
+                return None
+            self._sessions.move_to_end(bill_id)
+            return session
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.updated >= cutoff:
+                break
+            self._sessions.popitem(last=False)
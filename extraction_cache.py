@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Extraction cache for NBS - Newtown Bill Splitter App
+Remembers what was extracted from a receipt image so re-uploads skip Gemini and OCR.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Width/height of the difference hash grid (hash has HASH_SIZE * HASH_SIZE bits)
+HASH_SIZE = 16
+
+
+def content_hash(image_bytes: bytes) -> str:
+    """SHA-256 of the raw upload bytes"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """
+    Difference hash of the image, stable across recompression and resizing
+    """
+    try:
+        from PIL import Image
+        image = Image.open(io.BytesIO(image_bytes))
+        # JPEG draft mode decodes at reduced scale, so phone photos stay cheap
+        image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+        pixels = list(small.getdata())
+    except Exception as e:
+        print(f"Perceptual hash failed: {e}")
+        return None
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of extraction results with a disk-backed store.
+
+    Entries are keyed on the SHA-256 of the upload and also matched on a
+    perceptual hash, so a recompressed copy of the same photo is a hit.
+    Each entry is one JSON file in ``cache_dir``, and the directory is the
+    source of truth: the in-memory index picks up files written or removed
+    by other processes sharing it (e.g. pre-forked workers) whenever the
+    directory changes, so a receipt cached by one worker is a hit in all of
+    them and ``max_entries`` bounds the directory, not each worker's share.
+    Entries expire after ``max_age`` seconds and the least recently used
+    ones are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 256,
+                 max_age: float = 7 * 24 * 3600, phash_threshold: int = 12):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.phash_threshold = phash_threshold
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Directory mtime at the last scan, to skip rescans when nothing changed
+        self._dir_mtime: Optional[int] = None
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._lock:
+            self._sync()
+            self._evict()
+
+    def keys_for(self, image_bytes: bytes) -> Tuple[str, Optional[int]]:
+        """Compute the (content hash, perceptual hash) pair for an upload"""
+        return content_hash(image_bytes), perceptual_hash(image_bytes)
+
+    def lookup(self, keys: Tuple[str, Optional[int]]) -> Optional[Dict[str, Any]]:
+        """Return the cached result for these keys, or None"""
+        sha, phash = keys
+        now = time.time()
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(sha)
+            if entry is None:
+                # Written by another process since the last scan (directory mtimes can be coarse)
+                entry = self._read(sha)
+                if entry is not None:
+                    self._entries[sha] = entry
+            if entry is None and phash is not None:
+                entry = self._closest_by_phash(phash)
+                if entry is not None:
+                    self.phash_hits += 1
+
+            if entry is not None and now - entry['created'] > self.max_age:
+                self._remove(entry['sha256'])
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(entry['sha256'])
+            return {
+                'items': [dict(item) for item in entry['items']],
+                'method': entry['method'],
+                'extracted_text': entry['extracted_text'],
+            }
+
+    def store(self, keys: Tuple[str, Optional[int]], result: Dict[str, Any]):
+        """Save an extraction result under these keys"""
+        sha, phash = keys
+        entry = {
+            'sha256': sha,
+            'phash': phash,
+            'created': time.time(),
+            'items': [{'name': item['name'], 'price': item['price']} for item in result['items']],
+            'method': result['method'],
+            'extracted_text': result.get('extracted_text', ''),
+        }
+        with self._lock:
+            self._sync()
+            self._write(entry)
+            self._entries[sha] = entry
+            self._entries.move_to_end(sha)
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'phash_hits': self.phash_hits,
+                'misses': self.misses,
+            }
+
+    def _closest_by_phash(self, phash: int) -> Optional[Dict[str, Any]]:
+        best, best_distance = None, self.phash_threshold + 1
+        for entry in self._entries.values():
+            if entry['phash'] is None:
+                continue
+            distance = hamming_distance(phash, entry['phash'])
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha}.json")
+
+    def _write(self, entry: Dict[str, Any]):
+        path = self._path(entry['sha256'])
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing cache entry: {e}")
+
+    def _remove(self, sha: str):
+        self._entries.pop(sha, None)
+        try:
+            os.remove(self._path(sha))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _read(self, sha: str) -> Optional[Dict[str, Any]]:
+        """The entry stored under ``sha``, or None if there is none or it has expired"""
+        path = self._path(sha)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Skipping unreadable cache entry {sha}: {e}")
+            return None
+        if time.time() - entry.get('created', 0) > self.max_age:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _sync(self):
+        """Bring the index in line with the directory, if it changed since the last scan"""
+        try:
+            mtime = os.stat(self.cache_dir).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._dir_mtime:
+            return
+        self._dir_mtime = mtime
+        on_disk = {name[:-len('.json')] for name in os.listdir(self.cache_dir) if name.endswith('.json')}
+        for sha in [sha for sha in self._entries if sha not in on_disk]:
+            # Evicted or expired by another process
+            del self._entries[sha]
+        loaded = [entry for entry in map(self._read, on_disk - self._entries.keys()) if entry is not None]
+        # Oldest first, so the LRU order roughly matches creation order
+        for entry in sorted(loaded, key=lambda e: e['created']):
+            self._entries[entry['sha256']] = entry
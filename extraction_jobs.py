@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Background extraction jobs for NBS - Newtown Bill Splitter App
+Runs the receipt extraction chain on a bounded worker pool so uploads return immediately.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue already holds the maximum number of pending jobs"""
+
+
+class ExtractionJob:
+    """A single queued upload and the progress events it has produced"""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = 'queued'
+        self.events: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def report(self, message: str):
+        """Record a progress message, e.g. "Gemini failed, trying OCR" """
+        with self._changed:
+            self.events.append({'time': time.time(), 'message': message})
+            self._changed.notify_all()
+
+    def _set_status(self, status: str):
+        with self._changed:
+            self.status = status
+            if self.done:
+                self.finished = time.time()
+                # The image bytes are no longer needed once the job has run
+                self.payload = {}
+            self._changed.notify_all()
+
+    def wait_for_events(self, seen: int, timeout: float) -> bool:
+        """Block until there are more than ``seen`` events or the job finishes"""
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self.events) > seen or self.done, timeout)
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'finished': self.finished,
+            'events': list(self.events),
+        }
+        if include_result and self.result is not None:
+            data['result'] = self.result
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class ExtractionJobQueue:
+    """
+    Bounded pool of workers running ``run_job`` for each submitted job.
+
+    At most ``max_workers`` receipts are processed at once and at most
+    ``max_pending`` may wait behind them; finished jobs are kept for
+    ``job_ttl`` seconds so clients can collect the result.
+    """
+
+    def __init__(self, run_job: Callable[[ExtractionJob], Dict[str, Any]],
+                 max_workers: int = 2, max_pending: int = 32, job_ttl: float = 600):
+        self.run_job = run_job
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._jobs: Dict[str, ExtractionJob] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extraction')
+        self.rejected = 0
+        # Moving average of how long a job runs, for Retry-After
+        self._run_seconds = 5.0
+
+    def submit(self, payload: Dict[str, Any]) -> ExtractionJob:
+        """Queue a job, raising QueueFullError when the backlog is at capacity"""
+        job = ExtractionJob(payload)
+        with self._lock:
+            self._expire_finished()
+            pending = self._pending()
+            if pending >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f'{pending} receipts already in progress')
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def check_capacity(self):
+        """Raise QueueFullError if submit() would be refused right now (before reading an upload)"""
+        with self._lock:
+            pending = self._pending()
+            if pending >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f'{pending} receipts already in progress')
+
+    def retry_after(self) -> float:
+        """Rough seconds until a worker frees up for a new job"""
+        with self._lock:
+            return (self._pending() - self.max_workers + 1) / self.max_workers * self._run_seconds
+
+    def get(self, job_id: str) -> Optional[ExtractionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stream_events(self, job: ExtractionJob, heartbeat: float = 15) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Yield progress events as they happen until the job finishes.
+        Yields None when nothing happened for ``heartbeat`` seconds.
+        """
+        seen = 0
+        while True:
+            has_news = job.wait_for_events(seen, heartbeat)
+            events = job.events[seen:]
+            seen += len(events)
+            for event in events:
+                yield event
+            if job.done and seen == len(job.events):
+                return
+            if not has_news:
+                yield None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'max_workers': self.max_workers, 'max_pending': self.max_pending, 'jobs': counts,
+                'rejected': self.rejected}
+
+    def shutdown(self, wait: bool = True):
+        """Stop taking jobs; with ``wait`` the ones already queued are finished first"""
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: ExtractionJob):
+        job._set_status('running')
+        start = time.monotonic()
+        try:
+            job.result = self.run_job(job)
+            job._set_status('done')
+        except Exception as e:
+            print(f"❌ Extraction job {job.id} failed: {e}")
+            job.error = str(e)
+            job._set_status('failed')
+        with self._lock:
+            self._run_seconds += (time.monotonic() - start - self._run_seconds) * 0.2
+
+    def _pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _expire_finished(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Upload ingest for NBS - Newtown Bill Splitter App
+Reads uploads in chunks, rejecting non-images and oversized photos before the rest arrives.
+"""
+
+from typing import BinaryIO, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+# Bytes needed to tell the formats apart (WebP puts its marker at offset 8)
+SNIFF_BYTES = 12
+# JPEG headers can carry large EXIF blocks (with thumbnails) before the frame size
+MAX_HEADER_BYTES = 512 * 1024
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is not an acceptable image; ``status`` is the HTTP status to return"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Image format from the file's magic bytes, or None if it is not a supported image"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    return None
+
+
+def read_upload(stream: BinaryIO, max_bytes: int, max_pixels: int,
+                max_side: int) -> Tuple[bytes, str, Optional[Tuple[int, int]]]:
+    """
+    Read an uploaded image from ``stream`` chunk by chunk.
+
+    The first bytes must be image magic bytes, and as soon as the header
+    gives the dimensions they are checked against ``max_pixels`` and
+    ``max_side``; either way a bad upload is rejected before the rest of it is
+    read. Returns (bytes, format, (width, height) or None if the header was
+    not understood) or raises UploadRejected.
+    """
+    from PIL import ImageFile
+
+    chunks = []
+    received = 0
+    kind = None
+    size = None
+    parser: Optional[ImageFile.Parser] = ImageFile.Parser()
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadRejected(f'Image is larger than {max_bytes // (1024 * 1024)}MB', 413)
+        chunks.append(chunk)
+        # The magic bytes may arrive over several short reads
+        if kind is None and received >= SNIFF_BYTES:
+            kind = _sniff(chunks)
+
+        if parser is not None:
+            try:
+                parser.feed(chunk)
+            except Exception:
+                # Leave a header PIL cannot read to the decoder, which reports it properly
+                parser = None
+                continue
+            if parser.image is not None:
+                size = parser.image.size
+                parser = None
+                width, height = size
+                if width * height > max_pixels or max(width, height) > max_side:
+                    raise UploadRejected(f'Image is too large ({width}x{height} pixels)', 413)
+            elif received > MAX_HEADER_BYTES:
+                parser = None
+
+    if not chunks:
+        raise UploadRejected('Empty upload')
+    if kind is None:
+        kind = _sniff(chunks)
+    return b''.join(chunks), kind, size
+
+
+def _sniff(chunks) -> str:
+    kind = sniff_image_type(b''.join(chunks)[:SNIFF_BYTES])
+    if kind is None:
+        raise UploadRejected('File is not a supported image (JPG, PNG, GIF, WebP or BMP)', 415)
+    return kind
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Lazy imports for NBS - Newtown Bill Splitter App
+Defers the image/OCR stack (OpenCV, NumPy, PIL, pytesseract) until it is first used or warmed up.
+"""
+
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Iterable, Optional
+
+_modules: Dict[str, 'LazyModule'] = {}
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access.
+
+    Only this object is lazy (sys.modules is untouched), so other code that
+    imports the module directly is unaffected. The import runs once, under a
+    lock, and how long it took is kept for the startup profile.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+        self.import_seconds: Optional[float] = None
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    self.import_seconds = time.perf_counter() - start
+                module = self._module
+        return module
+
+
+def lazy_module(name: str) -> LazyModule:
+    """The shared lazy stand-in for module ``name``"""
+    module = _modules.get(name)
+    if module is None:
+        module = _modules.setdefault(name, LazyModule(name))
+    return module
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Import the lazy modules now (all of them by default) and return the
+    seconds each import took. Modules that are not installed are skipped;
+    the code using them reports that when it runs.
+    """
+    for name in list(names) if names is not None else list(_modules):
+        try:
+            lazy_module(name)._load()
+        except ImportError as e:
+            print(f"⚠️ Warm-up could not import {name}: {e}")
+    return import_times()
+
+
+def warm_up_in_background(names: Optional[Iterable[str]] = None) -> threading.Thread:
+    thread = threading.Thread(target=warm_up, args=(list(names) if names is not None else None,),
+                              name='import-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def import_times() -> Dict[str, float]:
+    """Seconds taken by each lazy module imported so far"""
+    return {name: module.import_seconds for name, module in _modules.items() if module.import_seconds is not None}
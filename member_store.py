@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Member storage for NBS - Newtown Bill Splitter App
+Named groups of members in SQLite (WAL mode), with an in-process read cache.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_GROUP = 'default'
+
+
+def connect_database(path: str) -> sqlite3.Connection:
+    """
+    Open the app database shared by the stores. WAL lets readers (other
+    workers included) carry on while one connection writes.
+    """
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute('PRAGMA foreign_keys=ON')
+    return connection
+
+
+class MemberStore:
+    """
+    Member lists per named group.
+
+    Reads are served from an in-process cache. The cache is dropped when this
+    store writes and when another process has committed to the database
+    (SQLite's data_version), so repeated lookups never parse or re-query
+    anything. Updates run in one transaction, so concurrent changes cannot
+    interleave or lose each other.
+    """
+
+    def __init__(self, path: str, legacy_json: Optional[str] = None):
+        self.path = path
+        self._db = connect_database(path)
+        self._lock = threading.RLock()
+        self._cache: Dict[str, List[str]] = {}
+        self._groups_cache: Optional[List[Dict[str, Any]]] = None
+        self._data_version: Optional[int] = None
+        self._create_schema()
+        if legacy_json:
+            self._import_legacy(legacy_json)
+
+    def reconnect(self):
+        """Open a fresh connection; call in a forked child, which must not share the parent's"""
+        with self._lock:
+            self._db = connect_database(self.path)
+            self._data_version = None
+            self._invalidate()
+
+    def get_members(self, group: str = DEFAULT_GROUP) -> List[str]:
+        """Members of a group, in the order they were added (empty for an unknown group)"""
+        with self._lock:
+            self._check_external_changes()
+            members = self._cache.get(group)
+            if members is None:
+                rows = self._db.execute(
+                    'SELECT m.name FROM members m JOIN groups g ON g.id = m.group_id '
+                    'WHERE g.name = ? ORDER BY m.position', (group,)
+                ).fetchall()
+                members = self._cache[group] = [row['name'] for row in rows]
+            return list(members)
+
+    def set_members(self, members: Iterable[str], group: str = DEFAULT_GROUP) -> List[str]:
+        """Replace a group's member list (creating the group if needed)"""
+        members = clean_member_names(members)
+        with self._lock, self._transaction():
+            group_id = self._group_id(group, create=True)
+            self._db.execute('DELETE FROM members WHERE group_id = ?', (group_id,))
+            self._db.executemany(
+                'INSERT INTO members (group_id, position, name) VALUES (?, ?, ?)',
+                [(group_id, position, name) for position, name in enumerate(members)]
+            )
+        return members
+
+    def update_members(self, add: Iterable[str] = (), remove: Iterable[str] = (),
+                       group: str = DEFAULT_GROUP) -> List[str]:
+        """Add and remove members in one transaction; returns the new list"""
+        add, remove = clean_member_names(add), set(remove)
+        with self._lock, self._transaction():
+            group_id = self._group_id(group, create=True)
+            if remove:
+                self._db.executemany('DELETE FROM members WHERE group_id = ? AND name = ?',
+                                     [(group_id, name) for name in remove])
+            next_position = self._db.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM members WHERE group_id = ?', (group_id,)
+            ).fetchone()[0]
+            for name in add:
+                cursor = self._db.execute(
+                    'INSERT OR IGNORE INTO members (group_id, position, name) VALUES (?, ?, ?)',
+                    (group_id, next_position, name)
+                )
+                next_position += cursor.rowcount
+        return self.get_members(group)
+
+    def delete_group(self, group: str) -> bool:
+        with self._lock, self._transaction():
+            cursor = self._db.execute('DELETE FROM groups WHERE name = ?', (group,))
+        return cursor.rowcount > 0
+
+    def list_groups(self) -> List[Dict[str, Any]]:
+        """Every group with its member count and last update time"""
+        with self._lock:
+            self._check_external_changes()
+            if self._groups_cache is None:
+                rows = self._db.execute(
+                    'SELECT g.name, g.updated, COUNT(m.name) AS member_count FROM groups g '
+                    'LEFT JOIN members m ON m.group_id = g.id GROUP BY g.id ORDER BY g.name'
+                ).fetchall()
+                self._groups_cache = [dict(row) for row in rows]
+            return [dict(group) for group in self._groups_cache]
+
+    def group_exists(self, group: str) -> bool:
+        return any(entry['name'] == group for entry in self.list_groups())
+
+    def _group_id(self, group: str, create: bool = False) -> Optional[int]:
+        if create:
+            self._db.execute(
+                'INSERT INTO groups (name, updated) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET updated = excluded.updated', (group, time.time())
+            )
+        row = self._db.execute('SELECT id FROM groups WHERE name = ?', (group,)).fetchone()
+        return row['id'] if row else None
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def _invalidate(self):
+        self._cache.clear()
+        self._groups_cache = None
+
+    def _check_external_changes(self):
+        # data_version changes only when another connection (e.g. another worker) commits
+        version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._invalidate()
+            self._data_version = version
+
+    def _create_schema(self):
+        with self._lock:
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS groups (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS members (
+                    group_id INTEGER NOT NULL REFERENCES groups(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    PRIMARY KEY (group_id, name)
+                );
+                CREATE INDEX IF NOT EXISTS members_by_position ON members (group_id, position);
+            ''')
+
+    def _import_legacy(self, legacy_json: str):
+        """Seed the default group from saved_members.json the first time the store is created"""
+        if not os.path.exists(legacy_json):
+            return
+        with self._lock, self._transaction():
+            if self._group_id(DEFAULT_GROUP) is not None:
+                return
+            try:
+                with open(legacy_json, 'r') as f:
+                    members = json.load(f)
+            except Exception as e:
+                print(f"Error loading saved members: {e}")
+                return
+            group_id = self._group_id(DEFAULT_GROUP, create=True)
+            self._db.executemany(
+                'INSERT OR IGNORE INTO members (group_id, position, name) VALUES (?, ?, ?)',
+                [(group_id, position, name) for position, name in enumerate(clean_member_names(members))]
+            )
+            print(f"✅ Imported {len(members)} members from {legacy_json}")
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (or ROLLBACK) that also drops the read cache"""
+
+    def __init__(self, store: MemberStore):
+        self.store = store
+
+    def __enter__(self):
+        self.store._db.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.store._db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        self.store._invalidate()
+        # Our own commit does not change data_version on this connection
+        return False
+
+
+def clean_member_names(members: Iterable[Any]) -> List[str]:
+    """Strip names, drop blanks and duplicates, keep the order"""
+    names = (str(member).strip() for member in members)
+    return list(dict.fromkeys(name for name in names if name))
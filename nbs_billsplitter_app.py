@@ -4,31 +4,265 @@ NBS - Newtown Bill Splitter App
 A comprehensive bill splitting application with image processing and smart calculation features.
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from __future__ import annotations
+
+from flask import Flask, Request, Response, render_template, request, jsonify, send_from_directory
 import os
 import json
 import base64
 from datetime import datetime
+from werkzeug.datastructures import FileStorage
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import tempfile
-from typing import List, Dict, Any
+import io
+import math
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 import re
-import cv2
-import numpy as np
-import pytesseract
-from PIL import Image
-import requests
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from admission import Overloaded, RateLimiter, StageLimiter
+from extraction_cache import ExtractionCache
+from extraction_jobs import ExtractionJobQueue, QueueFullError
+from image_ingest import UploadRejected, read_upload
+from ocr_engines import EngineUnavailable, create_default_registry
+from settlement import SettlementCache
+from request_batcher import RequestBatcher
+from resilience import PERMANENT_GRPC_CODES, BackendUnavailable, CircuitBreaker, PermanentBackendError, ResilientBackend
+from bill_history import BillHistory
+from bill_sessions import BillSessionStore
+from member_store import DEFAULT_GROUP, MemberStore
+from metrics import MetricsRegistry, collect_timings, record_timing, timed
+from lazy_imports import lazy_module, warm_up, warm_up_in_background
+
+# The image/OCR stack loads on first use (or warm_up), so workers that only calculate
+# bills or manage members never pay for it
+cv2 = lazy_module('cv2')
+np = lazy_module('numpy')
+pytesseract = lazy_module('pytesseract')
+Image = lazy_module('PIL.Image')
+requests = lazy_module('requests')
+# Imported by warm_up (see start_app.py) so the first upload does not wait for them
+WARMUP_MODULES = ['numpy', 'cv2', 'PIL.Image', 'pytesseract', 'split_engine', 'ocr_workers']
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+class NBSRequest(Request):
+    """Request with a larger body limit for bulk uploads than for everything else"""
+
+    @property
+    def max_content_length(self):
+        if self.path == '/upload/bulk':
+            return app.config['BULK_MAX_CONTENT_LENGTH']
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = NBSRequest
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Uploads are checked while they are read: image magic bytes, then pixel dimensions
+app.config['MAX_IMAGE_PIXELS'] = int(os.getenv('NBS_MAX_IMAGE_PIXELS', str(50 * 1000 * 1000)))
+app.config['MAX_IMAGE_SIDE'] = int(os.getenv('NBS_MAX_IMAGE_SIDE', '12000'))
+# Decode JPEG photos at half size when their text stays legible
+app.config['REDUCED_DECODE'] = os.getenv('NBS_REDUCED_DECODE', '1').lower() in ('1', 'true', 'yes')
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# File to store saved members
+# Import the image/OCR stack at startup in the background (it is otherwise loaded on first use)
+app.config['WARMUP'] = os.getenv('NBS_WARMUP', '1').lower() in ('1', 'true', 'yes')
+
+# Uploads are processed in memory; set NBS_DEBUG_IMAGES=1 to keep the upload and
+# preprocessed images in the upload folder for inspection
+app.config['SAVE_DEBUG_IMAGES'] = os.getenv('NBS_DEBUG_IMAGES', '').lower() in ('1', 'true', 'yes')
+
+# Image preprocessing tier and scaling targets (see preprocess_image_advanced)
+app.config['PREPROCESS_MODE'] = os.getenv('NBS_PREPROCESS_MODE', 'balanced')
+app.config['PREPROCESS_TARGET_TEXT_HEIGHT'] = float(os.getenv('NBS_PREPROCESS_TEXT_HEIGHT', '30'))
+app.config['PREPROCESS_MAX_LONG_EDGE'] = int(os.getenv('NBS_PREPROCESS_MAX_LONG_EDGE', '2500'))
+
+# Extraction cache (re-uploads of the same receipt skip Gemini/OCR)
+app.config['EXTRACTION_CACHE_DIR'] = os.getenv('NBS_EXTRACTION_CACHE_DIR', 'extraction_cache')
+app.config['EXTRACTION_CACHE_MAX_ENTRIES'] = int(os.getenv('NBS_EXTRACTION_CACHE_MAX_ENTRIES', '256'))
+app.config['EXTRACTION_CACHE_MAX_AGE'] = float(os.getenv('NBS_EXTRACTION_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+extraction_cache = ExtractionCache(
+    app.config['EXTRACTION_CACHE_DIR'],
+    max_entries=app.config['EXTRACTION_CACHE_MAX_ENTRIES'],
+    max_age=app.config['EXTRACTION_CACHE_MAX_AGE'],
+)
+
+# OCR engines (EasyOCR reader, Vision client, Gemini model) are loaded once and shared.
+# NBS_PRELOAD_ENGINES=easyocr,gemini loads them in the background at startup
+# (in production mode, start_app.py loads them before forking the workers instead).
+app.config['PRELOAD_ENGINES'] = [name.strip() for name in os.getenv('NBS_PRELOAD_ENGINES', '').split(',')
+                                 if name.strip()]
+ocr_engines = create_default_registry()
+if app.config['PRELOAD_ENGINES'] and os.getenv('NBS_SERVE_MODE', 'dev') != 'production':
+    ocr_engines.preload_in_background(app.config['PRELOAD_ENGINES'])
+
+# Remote backends get a per-call deadline, jittered retries and a circuit breaker that
+# skips the backend for a cool-off period after repeated failures (see /api/backends)
+app.config['GEMINI_TIMEOUT'] = float(os.getenv('NBS_GEMINI_TIMEOUT', '15'))
+app.config['GEMINI_RETRIES'] = int(os.getenv('NBS_GEMINI_RETRIES', '1'))
+app.config['GOOGLE_VISION_TIMEOUT'] = float(os.getenv('NBS_GOOGLE_VISION_TIMEOUT', '10'))
+app.config['GOOGLE_VISION_RETRIES'] = int(os.getenv('NBS_GOOGLE_VISION_RETRIES', '1'))
+app.config['BREAKER_FAILURE_THRESHOLD'] = int(os.getenv('NBS_BREAKER_FAILURES', '3'))
+app.config['BREAKER_COOL_OFF'] = float(os.getenv('NBS_BREAKER_COOL_OFF', '60'))
+remote_backends = {
+    name: ResilientBackend(
+        name,
+        timeout=app.config[f'{prefix}_TIMEOUT'],
+        retries=app.config[f'{prefix}_RETRIES'],
+        breaker=CircuitBreaker(app.config['BREAKER_FAILURE_THRESHOLD'], app.config['BREAKER_COOL_OFF'])
+    )
+    for name, prefix in (('gemini', 'GEMINI'), ('google_vision', 'GOOGLE_VISION'))
+}
+
+# Gemini payloads are cropped to the receipt, downscaled to NBS_GEMINI_MAX_EDGE pixels on the
+# long edge and sent as a grayscale JPEG with no metadata (NBS_GEMINI_OPTIMIZE=0 sends the full image).
+# While a Gemini call is in flight, receipts arriving within NBS_GEMINI_BATCH_WAIT seconds of each other
+# share one call, up to NBS_GEMINI_BATCH_SIZE receipts (1 turns batching off); a lone receipt goes at once
+app.config['GEMINI_OPTIMIZE_PAYLOAD'] = os.getenv('NBS_GEMINI_OPTIMIZE', '1').lower() in ('1', 'true', 'yes')
+app.config['GEMINI_MAX_EDGE'] = int(os.getenv('NBS_GEMINI_MAX_EDGE', '1600'))
+app.config['GEMINI_JPEG_QUALITY'] = int(os.getenv('NBS_GEMINI_JPEG_QUALITY', '75'))
+app.config['GEMINI_BATCH_SIZE'] = int(os.getenv('NBS_GEMINI_BATCH_SIZE', '4'))
+app.config['GEMINI_BATCH_WAIT'] = float(os.getenv('NBS_GEMINI_BATCH_WAIT', '0.1'))
+
+# Enhanced Tesseract: passes are started in order, NBS_TESSERACT_PASS_WINDOW at a time, and no more
+# are started once one is confident enough
+app.config['TESSERACT_WORKERS'] = int(os.getenv('NBS_TESSERACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+app.config['TESSERACT_PASS_WINDOW'] = int(os.getenv('NBS_TESSERACT_PASS_WINDOW', '2'))
+app.config['TESSERACT_CONFIDENCE_THRESHOLD'] = float(os.getenv('NBS_TESSERACT_CONFIDENCE', '80'))
+app.config['TESSERACT_MIN_WORDS'] = int(os.getenv('NBS_TESSERACT_MIN_WORDS', '5'))
+# NBS_TESSERACT_MODE=lines finds the text lines once and reads each one on its own (--psm 7) across
+# the pool instead of running whole-page passes; lines read below NBS_TESSERACT_LINE_CONFIDENCE are retried
+app.config['TESSERACT_MODE'] = os.getenv('NBS_TESSERACT_MODE', 'page')
+app.config['TESSERACT_LINE_CONFIDENCE'] = float(os.getenv('NBS_TESSERACT_LINE_CONFIDENCE', '60'))
+
+# Admission control. /upload runs at most NBS_UPLOAD_LIMIT requests at once; up to NBS_UPLOAD_QUEUE
+# more wait for NBS_UPLOAD_QUEUE_WAIT seconds and the rest get 429 with Retry-After straight away.
+# Within the pipeline, decoding, preprocessing and Tesseract each run at most NBS_LIMIT_<STAGE> at a
+# time, whichever route the receipt came in on. Each client may start NBS_RATE_BURST uploads at once,
+# refilled at NBS_RATE_LIMIT per second (0 turns rate limiting off). The limits are per process.
+app.config['UPLOAD_LIMIT'] = int(os.getenv('NBS_UPLOAD_LIMIT', str(max(2, os.cpu_count() or 1))))
+app.config['UPLOAD_QUEUE'] = int(os.getenv('NBS_UPLOAD_QUEUE', '8'))
+app.config['UPLOAD_QUEUE_WAIT'] = float(os.getenv('NBS_UPLOAD_QUEUE_WAIT', '10'))
+app.config['STAGE_LIMITS'] = {
+    stage: int(os.getenv(f'NBS_LIMIT_{stage.upper()}', str(os.cpu_count() or 1)))
+    for stage in ('decode', 'preprocess', 'ocr')
+}
+app.config['RATE_LIMIT'] = float(os.getenv('NBS_RATE_LIMIT', '0.5'))
+app.config['RATE_BURST'] = float(os.getenv('NBS_RATE_BURST', '10'))
+upload_limiter = StageLimiter('upload', app.config['UPLOAD_LIMIT'], max_queue=app.config['UPLOAD_QUEUE'],
+                              max_wait=app.config['UPLOAD_QUEUE_WAIT'])
+# Admitted uploads are already bounded, so inside the pipeline callers just wait their turn
+decode_limiter = StageLimiter('decode', app.config['STAGE_LIMITS']['decode'])
+preprocess_limiter = StageLimiter('preprocess', app.config['STAGE_LIMITS']['preprocess'])
+ocr_limiter = StageLimiter('ocr', app.config['STAGE_LIMITS']['ocr'])
+rate_limiter = RateLimiter(app.config['RATE_LIMIT'], app.config['RATE_BURST'])
+
+# Behind a reverse proxy every request comes from the proxy's address, so all clients would share
+# one rate-limit bucket. NBS_TRUSTED_PROXIES is the number of proxies in front of the app; their
+# X-Forwarded-For and X-Forwarded-Proto headers are trusted for the client's address and scheme.
+# Leave it at 0 when clients reach the app directly, or they could forge the header.
+app.config['TRUSTED_PROXIES'] = int(os.getenv('NBS_TRUSTED_PROXIES', '0'))
+if app.config['TRUSTED_PROXIES'] > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'],
+                            x_proto=app.config['TRUSTED_PROXIES'])
+
+# Extraction strategy (NBS_EXTRACTION_MODE):
+#   sequential - Gemini, then EasyOCR, Vision and Tesseract in turn (each only if the previous failed)
+#   race       - start the engines in NBS_RACE_ENGINES together and take the first one that finds items
+app.config['EXTRACTION_MODE'] = os.getenv('NBS_EXTRACTION_MODE', 'sequential')
+app.config['EXTRACTION_RACE_ENGINES'] = [name.strip() for name in os.getenv(
+    'NBS_RACE_ENGINES', 'gemini,easyocr,google_vision,tesseract').split(',') if name.strip()]
+# 'first' takes the first usable result; 'prefer_quality' gives better-ranked engines a grace period
+app.config['EXTRACTION_RACE_POLICY'] = os.getenv('NBS_RACE_POLICY', 'prefer_quality')
+app.config['EXTRACTION_RACE_GRACE'] = float(os.getenv('NBS_RACE_GRACE', '2'))
+app.config['EXTRACTION_ENGINE_DEADLINES'] = {
+    'gemini': float(os.getenv('NBS_GEMINI_DEADLINE', '20')),
+    'easyocr': float(os.getenv('NBS_EASYOCR_DEADLINE', '30')),
+    'google_vision': float(os.getenv('NBS_GOOGLE_VISION_DEADLINE', '15')),
+    'tesseract': float(os.getenv('NBS_TESSERACT_DEADLINE', '30')),
+}
+
+# Bills with at least this many items x members cells use the vectorised split engine;
+# below that the plain Python loop is faster than setting up the arrays
+app.config['SPLIT_ENGINE_MIN_CELLS'] = int(os.getenv('NBS_SPLIT_ENGINE_MIN_CELLS', '10000'))
+
+# Server-side bill sessions for incremental updates from the items page
+app.config['BILL_SESSION_TTL'] = float(os.getenv('NBS_BILL_SESSION_TTL', str(6 * 3600)))
+bill_sessions = BillSessionStore(ttl=app.config['BILL_SESSION_TTL'])
+
+# Latency histograms and outcome counters, scraped from /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('nbs_stage_seconds', 'Seconds spent in each upload stage', ['stage'])
+engine_seconds = metrics.histogram('nbs_engine_seconds', 'Seconds spent in each extraction engine', ['engine'])
+preprocess_step_seconds = metrics.histogram('nbs_preprocess_step_seconds', 'Seconds spent in each preprocessing step', ['step'])
+tesseract_pass_seconds = metrics.histogram('nbs_tesseract_pass_seconds', 'Seconds taken by each Tesseract configuration pass', ['config'])
+uploads_total = metrics.counter('nbs_uploads_total', 'Processed uploads by extraction method', ['method', 'cached'])
+engine_wins_total = metrics.counter('nbs_extraction_engine_wins_total', 'Extractions won by each engine', ['engine'])
+gemini_calls_total = metrics.counter('nbs_gemini_calls_total', 'Gemini model calls')
+gemini_receipts_total = metrics.counter('nbs_gemini_receipts_total', 'Receipts sent to Gemini')
+gemini_payload_bytes_total = metrics.counter('nbs_gemini_payload_bytes_total',
+                                             'Bytes of optimized receipt images sent to Gemini')
+
+def extraction_cache_metrics():
+    stats = extraction_cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    return [
+        ('nbs_extraction_cache_lookups_total', 'counter', 'Extraction cache lookups by result',
+         {(('result', 'hit'),): stats['hits'] - stats['phash_hits'],
+          (('result', 'phash_hit'),): stats['phash_hits'],
+          (('result', 'miss'),): stats['misses']}),
+        ('nbs_extraction_cache_hit_ratio', 'gauge', 'Share of extraction cache lookups that were hits',
+         {(): stats['hits'] / lookups if lookups else 0.0}),
+        ('nbs_extraction_cache_entries', 'gauge', 'Entries in the extraction cache',
+         {(): stats['entries']}),
+    ]
+
+metrics.add_collector(extraction_cache_metrics)
+
+def admission_stats() -> Dict[str, Any]:
+    limiters = (upload_limiter, decode_limiter, preprocess_limiter, ocr_limiter)
+    return {'stages': {limiter.name: limiter.stats() for limiter in limiters},
+            'rate_limit': rate_limiter.stats(), 'jobs': extraction_jobs.stats()}
+
+def admission_metrics():
+    stats = admission_stats()
+    stages = stats['stages']
+    return [
+        ('nbs_admission_active', 'gauge', 'Requests running in each admission-controlled stage',
+         {(('stage', name),): stage['active'] for name, stage in stages.items()}),
+        ('nbs_admission_queued', 'gauge', 'Requests waiting to enter each stage',
+         {**{(('stage', name),): stage['queued'] for name, stage in stages.items()},
+          (('stage', 'jobs'),): stats['jobs']['jobs'].get('queued', 0)}),
+        ('nbs_admission_rejected_total', 'counter', 'Requests turned away by each stage',
+         {**{(('stage', name), ('reason', reason)): count
+             for name, stage in stages.items() for reason, count in stage['rejected'].items()},
+          (('stage', 'jobs'), ('reason', 'queue_full')): stats['jobs']['rejected']}),
+        ('nbs_rate_limited_total', 'counter', 'Uploads refused by the per-client rate limit',
+         {(): stats['rate_limit']['limited']}),
+    ]
+
+metrics.add_collector(admission_metrics)
+
+# Saved members, per named group; saved_members.json is imported into the default group once
 MEMBERS_FILE = 'saved_members.json'
+app.config['DATABASE_PATH'] = os.getenv('NBS_DATABASE', 'nbs.db')
+member_store = MemberStore(app.config['DATABASE_PATH'], legacy_json=MEMBERS_FILE)
+bill_history = BillHistory(app.config['DATABASE_PATH'])
+
+# Who-pays-whom plans per group, updated as bills are saved
+app.config['SETTLE_EXACT_MAX_MEMBERS'] = int(os.getenv('NBS_SETTLE_EXACT_MAX_MEMBERS', '16'))
+app.config['SETTLE_TIME_BUDGET'] = float(os.getenv('NBS_SETTLE_TIME_BUDGET', '0.25'))
+settlements = SettlementCache(bill_history, exact_max_members=app.config['SETTLE_EXACT_MAX_MEMBERS'],
+                              time_budget=app.config['SETTLE_TIME_BUDGET'])
 
 # Allowed extensions for image upload
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
@@ -37,26 +271,32 @@ def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def load_saved_members():
-    """Load saved members from file"""
+def ingest_image(stream) -> bytes:
+    """Read one uploaded image in chunks, raising UploadRejected as soon as it is unacceptable"""
+    image_bytes, _, _ = read_upload(stream, app.config['MAX_CONTENT_LENGTH'],
+                                    app.config['MAX_IMAGE_PIXELS'], app.config['MAX_IMAGE_SIDE'])
+    return image_bytes
+
+def load_saved_members(group: str = DEFAULT_GROUP) -> List[str]:
+    """Load a group's saved members (served from the member store's cache)"""
     try:
-        if os.path.exists(MEMBERS_FILE):
-            with open(MEMBERS_FILE, 'r') as f:
-                return json.load(f)
+        return member_store.get_members(group)
     except Exception as e:
         print(f"Error loading saved members: {e}")
     return []
 
-def save_members(members):
-    """Save members to file"""
-    try:
-        with open(MEMBERS_FILE, 'w') as f:
-            json.dump(members, f)
-    except Exception as e:
-        print(f"Error saving members: {e}")
+def save_members(members, group: str = DEFAULT_GROUP) -> List[str]:
+    """Replace a group's saved members in one transaction"""
+    return member_store.set_members(members, group)
 
+@timed(stage_seconds, stage='calculate_totals')
 def calculate_totals(members, items, discount_percent=0):
     """Calculate totals for given members and items"""
+    # Large group bills go through the NumPy engine (same result structure)
+    if members and items and len(members) * len(items) >= app.config['SPLIT_ENGINE_MIN_CELLS']:
+        from split_engine import calculate_totals_vectorized
+        return calculate_totals_vectorized(members, items, discount_percent)
+
     if not members or not items:
         return {
             'subtotal': 0,
@@ -118,144 +358,428 @@ def calculate_totals(members, items, discount_percent=0):
         }
     }
 
-def preprocess_image_advanced(image_path: str) -> str:
+def decode_image(image_bytes: bytes, reduce: bool = False) -> Optional[np.ndarray]:
+    """
+    Decode uploaded image bytes into a BGR array without touching disk.
+    With ``reduce``, a JPEG is decoded at half size by libjpeg (a quarter of the
+    pixels, and faster than a full decode) and kept when its text is still at least
+    PREPROCESS_TARGET_TEXT_HEIGHT pixels tall; otherwise it is decoded at full size.
+    """
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    if reduce and image_bytes[:3] == b'\xff\xd8\xff':
+        image = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_COLOR_2)
+        if image is not None:
+            text_height = estimate_text_height(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+            if text_height and text_height >= app.config['PREPROCESS_TARGET_TEXT_HEIGHT']:
+                return image
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+def load_image(image) -> Optional[np.ndarray]:
+    """Accept a file path, encoded bytes or an already decoded array"""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return decode_image(bytes(image))
+    return cv2.imread(image)
+
+def to_pil_image(image) -> Image.Image:
+    """Accept a file path, encoded bytes, a BGR/grayscale array or a PIL image"""
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image))
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return Image.fromarray(image)
+        return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return Image.open(image)
+
+def to_image_bytes(image) -> bytes:
+    """Accept a file path, encoded bytes or an array and return encoded image bytes"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if isinstance(image, np.ndarray):
+        return cv2.imencode('.png', image)[1].tobytes()
+    with open(image, 'rb') as image_file:
+        return image_file.read()
+
+def save_debug_image(image, name: str):
     """
-    Advanced image preprocessing for better OCR results
+    Write an intermediate image to the upload folder when NBS_DEBUG_IMAGES is set
     """
+    if not app.config['SAVE_DEBUG_IMAGES']:
+        return
+    try:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f_')
+        path = os.path.join(app.config['UPLOAD_FOLDER'], timestamp + secure_filename(name))
+        if isinstance(image, np.ndarray):
+            cv2.imwrite(path, image)
+        else:
+            with open(path, 'wb') as f:
+                f.write(image)
+    except Exception as e:
+        print(f"Failed to save debug image {name}: {e}")
+
+# Preprocessing tiers (NBS_PREPROCESS_MODE):
+#   fast     - downscale to the target text height, crop to the receipt, median denoise
+#   balanced - as fast, but with an edge-preserving bilateral denoise
+#   quality  - full resolution with non-local means denoising (slow on phone photos)
+PREPROCESS_MODES = ('fast', 'balanced', 'quality')
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """
+    Estimate the typical character height in pixels from the connected
+    components of a small thumbnail. Returns None when nothing text-like is found.
+    """
+    scale = min(1.0, 800 / max(gray.shape))
+    thumbnail = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    binary = cv2.adaptiveThreshold(
+        thumbnail, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10
+    )
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    # Character-shaped blobs: a few pixels tall, not much wider than they are tall
+    glyphs = heights[(heights >= 4) & (heights <= 60) & (widths <= heights * 2) & (widths >= 2)]
+    if len(glyphs) < 20:
+        return None
+    return float(np.median(glyphs)) / scale
+
+def crop_to_receipt(gray: np.ndarray) -> np.ndarray:
+    """
+    Crop to the bright paper region, assuming it stands out from a darker background
+    """
+    scale = min(1.0, 500 / max(gray.shape))
+    thumbnail = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    _, paper = cv2.threshold(cv2.GaussianBlur(thumbnail, (5, 5), 0), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Close the gaps left by the printed text so the receipt is one blob
+    paper = cv2.morphologyEx(paper, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray
+
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    # Ignore tiny blobs, and crops that would keep nearly everything anyway
+    area_ratio = (w * h) / float(thumbnail.shape[0] * thumbnail.shape[1])
+    if area_ratio < 0.15 or area_ratio > 0.95:
+        return gray
+
+    margin = 5
+    x0 = max(int((x - margin) / scale), 0)
+    y0 = max(int((y - margin) / scale), 0)
+    x1 = min(int((x + w + margin) / scale), gray.shape[1])
+    y1 = min(int((y + h + margin) / scale), gray.shape[0])
+    return gray[y0:y1, x0:x1]
+
+def text_glyphs(binary: np.ndarray) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Boxes (top, left, height, width) of the character-sized blobs in a binarised
+    receipt (dark text on white) and the typical character height, or (None, 0).
+    Speckle from thresholding is plentiful but small, so the character height is
+    the peak of the blob height histogram with taller blobs weighted up.
+    """
+    ink = (binary < 128).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    tops, lefts = stats[1:, cv2.CC_STAT_TOP], stats[1:, cv2.CC_STAT_LEFT]
+    heights, widths = stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_WIDTH]
+    candidates = heights[(heights >= 8) & (heights <= binary.shape[0] // 8) & (widths <= heights * 4)]
+    if len(candidates) < 5:
+        return None, 0
+    histogram = np.bincount(candidates)
+    histogram[histogram < 5] = 0
+    weighted = np.convolve(histogram * np.arange(len(histogram)) ** 2, np.ones(5), mode='same')
+    glyph_height = int(np.argmax(weighted))
+    if not glyph_height:
+        return None, 0
+    # Letters that touch (e.g. "HB-MIX-MEAT") make wide blobs of the same height
+    glyphs = (heights >= glyph_height * 0.6) & (heights <= glyph_height * 1.5) & (widths <= heights * 20)
+    return np.stack([tops, lefts, heights, widths], axis=1)[glyphs], glyph_height
+
+def deskew_text(binary: np.ndarray, max_angle: float = 5.0) -> np.ndarray:
+    """
+    Rotate a binarised receipt so its text lines are level. The angle is the one
+    at which the character centres bunch up most tightly into rows.
+    """
+    glyphs, glyph_height = text_glyphs(binary)
+    if glyphs is None or len(glyphs) < 10:
+        return binary
+    centre_y = glyphs[:, 0] + glyphs[:, 2] / 2
+    centre_x = glyphs[:, 1] + glyphs[:, 3] / 2
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + 0.01, 0.25):
+        theta = np.deg2rad(angle)
+        rows = centre_y * np.cos(theta) - centre_x * np.sin(theta)
+        counts = np.bincount(((rows - rows.min()) / (glyph_height / 3)).astype(int)).astype(np.float64)
+        score = float((counts ** 2).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    if abs(best_angle) < 0.25:
+        return binary
+    height, width = binary.shape
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), best_angle, 1.0)
+    return cv2.warpAffine(binary, rotation, (width, height), flags=cv2.INTER_NEAREST, borderValue=255)
+
+def find_text_lines(binary: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """
+    Boxes (top, bottom, left, right) of the text lines in a level, binarised
+    receipt, top to bottom. The horizontal projection profile counts the
+    characters covering each row; a row is a gap when its count drops below
+    half of the peaks within a line height above and below it, so lines that
+    nearly touch are still told apart. Boxes taller than a line hold lines
+    that could not be separated.
+    """
+    glyphs, glyph_height = text_glyphs(binary)
+    if glyphs is None:
+        return []
+    tops, lefts, heights, widths = glyphs.T
+    profile = np.zeros(binary.shape[0] + 1, np.int32)
+    np.add.at(profile, tops, 1)
+    np.add.at(profile, tops + heights, -1)
+    profile = np.cumsum(profile[:-1])
+
+    peaks = np.lib.stride_tricks.sliding_window_view(np.pad(profile, glyph_height), glyph_height + 1).max(axis=1)
+    above, below = peaks[:len(profile)], peaks[glyph_height:glyph_height + len(profile)]
+    text_rows = (profile >= max(2, 0.1 * profile.max())) & (profile >= 0.5 * np.minimum(above, below))
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], text_rows, [0])).astype(np.int8)))
+
+    # Close small gaps (dots and accents above a line) as long as the result is still one line tall
+    bands = []
+    for start, end in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+        if bands and start - bands[-1][1] < glyph_height * 0.25 and end - bands[-1][0] <= glyph_height * 1.6:
+            bands[-1][1] = end
+        else:
+            bands.append([start, end])
+
+    lines = []
+    centres = tops + heights / 2
+    for top, bottom in bands:
+        inside = (centres >= top) & (centres < bottom)
+        if bottom - top < glyph_height * 0.5 or inside.sum() < 2:
+            continue
+        # The box takes in whole characters, descenders and all
+        lines.append((int(tops[inside].min()), int((tops[inside] + heights[inside]).max()),
+                      int(lefts[inside].min()), int((lefts[inside] + widths[inside]).max())))
+    return lines
+
+@preprocess_limiter.admit()
+@timed(stage_seconds, stage='preprocess')
+def preprocess_image_advanced(image, mode: Optional[str] = None,
+                              timings: Optional[Dict[str, float]] = None) -> Optional[np.ndarray]:
+    """
+    Advanced image preprocessing for better OCR results.
+    Takes a decoded array (or a path/bytes) and returns the processed grayscale array.
+    ``mode`` is one of PREPROCESS_MODES (default: app config); the seconds spent in
+    each stage are added to ``timings`` when given.
+    """
+    mode = mode or app.config['PREPROCESS_MODE']
+    timings = timings if timings is not None else {}
+    stage_start = time.perf_counter()
+
+    def finish_stage(name):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[name] = timings.get(name, 0.0) + now - stage_start
+        preprocess_step_seconds.observe(now - stage_start, step=name)
+        stage_start = now
+
     try:
         # Read image
-        image = cv2.imread(image_path)
+        image = load_image(image)
         if image is None:
-            return image_path
+            return None
+        finish_stage('decode')
         
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        finish_stage('grayscale')
+        
+        if mode != 'quality':
+            # Scale so characters are about TARGET_TEXT_HEIGHT pixels tall; phone photos
+            # are far larger than Tesseract needs
+            text_height = estimate_text_height(gray)
+            scale = app.config['PREPROCESS_TARGET_TEXT_HEIGHT'] / text_height if text_height else 1.0
+            scale = min(scale, app.config['PREPROCESS_MAX_LONG_EDGE'] / max(gray.shape), 2.0)
+            if abs(scale - 1.0) > 0.05:
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+                gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+            finish_stage('resize')
+            
+            gray = crop_to_receipt(gray)
+            finish_stage('crop')
         
         # Apply noise reduction
-        denoised = cv2.fastNlMeansDenoising(gray)
+        if mode == 'quality':
+            denoised = cv2.fastNlMeansDenoising(gray)
+        elif mode == 'balanced':
+            denoised = cv2.bilateralFilter(gray, 5, 50, 50)
+        else:
+            denoised = cv2.medianBlur(gray, 3)
+        finish_stage('denoise')
         
         # Apply adaptive thresholding for better text extraction
         adaptive_thresh = cv2.adaptiveThreshold(
             denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
         )
+        finish_stage('threshold')
         
-        # Apply morphological operations to clean up the image
-        kernel = np.ones((1, 1), np.uint8)
-        cleaned = cv2.morphologyEx(adaptive_thresh, cv2.MORPH_CLOSE, kernel)
-        
-        # Apply Gaussian blur to smooth edges
-        blurred = cv2.GaussianBlur(cleaned, (1, 1), 0)
-        
-        # Save processed image
-        processed_path = image_path.replace('.', '_processed.')
-        cv2.imwrite(processed_path, blurred)
-        
-        return processed_path
+        save_debug_image(adaptive_thresh, f'processed_{mode}.png')
+        return adaptive_thresh
     except Exception as e:
         print(f"Advanced image preprocessing failed: {e}")
-        return image_path
+        return load_image(image)
+
+GEMINI_PROMPT = """
+Analyze this restaurant receipt and extract all menu items with their prices.
+Return ONLY a JSON array with this exact format:
+[
+    {"name": "Item Name", "price": 12.99},
+    {"name": "Another Item", "price": 8.50}
+]
+
+Rules:
+- Only include actual menu items (not totals, taxes, tips, etc.)
+- Use the exact item names as they appear
+- Convert all prices to decimal numbers
+- Skip any lines that are clearly not food items
+- If you can't extract items, return an empty array []
+"""
+
+GEMINI_BATCH_PROMPT = """
+The following {count} images are separate restaurant receipts, labelled "Receipt 1" to "Receipt {count}".
+Analyze each receipt and extract all menu items with their prices.
+Return ONLY a JSON object with one array of items per receipt, in receipt order, with this exact format:
+{{"receipts": [
+    [{{"name": "Item Name", "price": 12.99}}, {{"name": "Another Item", "price": 8.50}}],
+    [{{"name": "Item From Receipt 2", "price": 4.25}}]
+]}}
+
+Rules:
+- Only include actual menu items (not totals, taxes, tips, etc.)
+- Use the exact item names as they appear
+- Convert all prices to decimal numbers
+- Skip any lines that are clearly not food items
+- Never mix items from different receipts
+- If you can't extract items from a receipt, use an empty array [] for it
+"""
+
+def prepare_gemini_image(image) -> Dict[str, Any]:
+    """
+    The receipt as an inline JPEG for Gemini: cropped to the paper, downscaled to
+    GEMINI_MAX_EDGE pixels on the long edge and grayscale at GEMINI_JPEG_QUALITY.
+    It is encoded from the pixels, so EXIF and other metadata are left behind.
+    """
+    image = load_image(image)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = crop_to_receipt(gray)
+    scale = app.config['GEMINI_MAX_EDGE'] / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', gray, [cv2.IMWRITE_JPEG_QUALITY, app.config['GEMINI_JPEG_QUALITY'],
+                                              cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    if not ok:
+        raise ValueError('Could not encode the Gemini payload')
+    return {'mime_type': 'image/jpeg', 'data': encoded.tobytes()}
+
+def clean_gemini_items(items: Any) -> List[Dict[str, Any]]:
+    """Keep well-formed items with a reasonable price, names in title case"""
+    valid_items = []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and 'name' in item and 'price' in item:
+            try:
+                price = float(item['price'])
+                if 0.01 <= price <= 1000:  # Reasonable price range
+                    valid_items.append({
+                        'name': str(item['name']).title(),
+                        'price': price
+                    })
+            except (ValueError, TypeError):
+                continue
+    return valid_items
+
+def parse_gemini_response(response_text: str, count: int) -> List[List[Dict[str, Any]]]:
+    """
+    Items per receipt from a Gemini reply: a JSON array for a single receipt, or
+    {"receipts": [...]} for a batch. A receipt missing from the reply gets no items.
+    """
+    opening, closing = ('[', ']') if count == 1 else ('{', '}')
+    json_start = response_text.find(opening)
+    json_end = response_text.rfind(closing) + 1
+    if json_start == -1 or json_end == 0:
+        raise ValueError(f'No valid JSON found in Gemini response: {response_text}')
+    parsed = json.loads(response_text[json_start:json_end])
+    receipts = [parsed] if count == 1 else parsed.get('receipts', []) if isinstance(parsed, dict) else []
+    receipts = list(receipts)[:count]
+    receipts += [[]] * (count - len(receipts))
+    return [clean_gemini_items(items) for items in receipts]
+
+def call_gemini(images: List[Any]) -> List[List[Dict[str, Any]]]:
+    """
+    Items for each receipt image (PIL images or inline JPEG dicts) from one
+    Gemini call, with the deadline, retries and circuit breaker of the resilience layer
+    """
+    model = ocr_engines.get('gemini')
+    if len(images) == 1:
+        contents = [GEMINI_PROMPT, images[0]]
+    else:
+        contents = [GEMINI_BATCH_PROMPT.format(count=len(images))]
+        for number, image in enumerate(images, 1):
+            contents += [f'Receipt {number}:', image]
+    gemini_calls_total.inc()
+    gemini_receipts_total.inc(len(images))
+    payload_bytes = sum(len(image['data']) for image in images if isinstance(image, dict))
+    if payload_bytes:
+        gemini_payload_bytes_total.inc(payload_bytes)
+
+    response = remote_backends['gemini'].call(
+        model.generate_content, contents,
+        request_options={'timeout': app.config['GEMINI_TIMEOUT']}
+    )
+    return parse_gemini_response(response.text.strip(), len(images))
+
+# Concurrent uploads (and the receipts of a bulk upload) share Gemini calls
+gemini_batcher = RequestBatcher(call_gemini, max_batch=app.config['GEMINI_BATCH_SIZE'],
+                                max_wait=app.config['GEMINI_BATCH_WAIT'])
 
-def extract_text_with_gemini(image_path: str) -> List[Dict[str, Any]]:
+@timed(engine_seconds, engine='gemini')
+def extract_text_with_gemini(image) -> List[Dict[str, Any]]:
     """
     Extract items and prices directly from image using Gemini Vision API
     """
     try:
-        import google.generativeai as genai
-        
-        # Get API key from environment variable
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            print("❌ GEMINI_API_KEY not found in environment variables")
+        # Shared model, configured once per process
+        try:
+            ocr_engines.get('gemini')
+        except EngineUnavailable as e:
+            print(f"❌ Gemini unavailable: {e}")
             return []
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Read image using PIL
-        from PIL import Image
-        pil_image = Image.open(image_path)
-        
-        # Create prompt for receipt parsing
-        prompt = """
-        Analyze this restaurant receipt and extract all menu items with their prices.
-        Return ONLY a JSON array with this exact format:
-        [
-            {"name": "Item Name", "price": 12.99},
-            {"name": "Another Item", "price": 8.50}
-        ]
-        
-        Rules:
-        - Only include actual menu items (not totals, taxes, tips, etc.)
-        - Use the exact item names as they appear
-        - Convert all prices to decimal numbers
-        - Skip any lines that are clearly not food items
-        - If you can't extract items, return an empty array []
-        """
-        
-        # Generate response
+
+        if app.config['GEMINI_OPTIMIZE_PAYLOAD']:
+            payload = prepare_gemini_image(image)
+        else:
+            payload = to_pil_image(image)
+
         try:
-            response = model.generate_content([prompt, pil_image])
-            
-            # Parse JSON response
-            try:
-                # Extract JSON from response text
-                response_text = response.text.strip()
-                
-                # Find JSON array in the response
-                json_start = response_text.find('[')
-                json_end = response_text.rfind(']') + 1
-                
-                if json_start != -1 and json_end != 0:
-                    json_str = response_text[json_start:json_end]
-                    items = json.loads(json_str)
-                    
-                    # Validate items
-                    valid_items = []
-                    for item in items:
-                        if isinstance(item, dict) and 'name' in item and 'price' in item:
-                            try:
-                                price = float(item['price'])
-                                if 0.01 <= price <= 1000:  # Reasonable price range
-                                    valid_items.append({
-                                        'name': item['name'].title(),
-                                        'price': price
-                                    })
-                            except (ValueError, TypeError):
-                                continue
-                    
-                    print(f"✅ Gemini extracted {len(valid_items)} items")
-                    return valid_items
-                else:
-                    print("❌ No valid JSON found in Gemini response")
-                    print(f"Response: {response_text}")
-                    return []
-                    
-            except json.JSONDecodeError as e:
-                print(f"❌ Failed to parse Gemini JSON response: {e}")
-                print(f"Response: {response.text}")
-                return []
-                
+            items = gemini_batcher.run(payload)
         except Exception as e:
             print(f"❌ Gemini API call failed: {e}")
             return []
-            
-    except ImportError:
-        print("❌ Google Generative AI library not installed")
-        print("Install with: pip install google-generativeai")
-        return []
+
+        print(f"✅ Gemini extracted {len(items)} items")
+        return items
+
     except Exception as e:
         print(f"❌ Gemini extraction failed: {e}")
         return []
 
-def extract_text_with_easyocr(image_path: str) -> str:
+@timed(engine_seconds, engine='easyocr')
+def extract_text_with_easyocr(image) -> str:
     """
     Extract text using EasyOCR (if available)
     """
     try:
-        import easyocr
-        reader = easyocr.Reader(['en'])
-        results = reader.readtext(image_path)
+        # Shared reader; the detection and recognition models load only once
+        with ocr_engines.using('easyocr') as reader:
+            results = reader.readtext(image)
         
         # Extract text from results
         text_lines = []
@@ -264,110 +788,242 @@ def extract_text_with_easyocr(image_path: str) -> str:
                 text_lines.append(text)
         
         return '\n'.join(text_lines)
-    except ImportError:
+    except EngineUnavailable:
         print("EasyOCR not available, falling back to Tesseract")
         return ""
     except Exception as e:
         print(f"EasyOCR extraction failed: {e}")
         return ""
 
-def extract_text_with_google_vision(image_path: str) -> str:
+@timed(engine_seconds, engine='google_vision')
+def extract_text_with_google_vision(image) -> str:
     """
     Extract text using Google Cloud Vision API (if configured)
     """
     try:
+        # Shared client, created once per process
+        client = ocr_engines.get('google_vision')
         from google.cloud import vision
         
-        # Initialize client
-        client = vision.ImageAnnotatorClient()
+        # Vision takes encoded bytes, so pass the original upload where possible
+        content = to_image_bytes(image)
         
-        # Read image file
-        with open(image_path, 'rb') as image_file:
-            content = image_file.read()
+        # Perform text detection (deadline, retries and circuit breaker via the resilience layer)
+        def detect():
+            response = client.text_detection(image=vision.Image(content=content),
+                                             timeout=app.config['GOOGLE_VISION_TIMEOUT'])
+            if response.error.message:
+                if response.error.code in PERMANENT_GRPC_CODES:
+                    raise PermanentBackendError(response.error.message)
+                raise RuntimeError(response.error.message)
+            return response
         
-        image = vision.Image(content=content)
-        
-        # Perform text detection
-        response = client.text_detection(image=image)
+        response = remote_backends['google_vision'].call(detect)
         texts = response.text_annotations
         
         if texts:
             return texts[0].description
         return ""
         
-    except ImportError:
+    except EngineUnavailable:
         print("Google Cloud Vision not available")
         return ""
+    except BackendUnavailable:
+        print("Google Vision skipped: circuit open after repeated failures")
+        return ""
     except Exception as e:
         print(f"Google Vision extraction failed: {e}")
         return ""
 
-def extract_text_with_tesseract_enhanced(image_path: str) -> str:
+# Tesseract configurations tried by the enhanced extractor, most likely to read a receipt first
+TESSERACT_CONFIGS = [
+    '--oem 3 --psm 6',  # Default
+    '--oem 3 --psm 11', # Sparse text
+    '--oem 1 --psm 6',  # Legacy engine
+    '--oem 3 --psm 8',  # Single word
+]
+
+_tesseract_pool = None
+_pool_lock = threading.Lock()
+
+def get_tesseract_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all Tesseract passes, created on first use"""
+    global _tesseract_pool
+    with _pool_lock:
+        if _tesseract_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _tesseract_pool = ProcessPoolExecutor(max_workers=app.config['TESSERACT_WORKERS'])
+        return _tesseract_pool
+
+TESSERACT_LINE_CONFIG = '--oem 3 --psm 7'  # Single text line
+TESSERACT_BLOCK_CONFIG = '--oem 3 --psm 6'  # Uniform block, for boxes holding several lines
+# Tried on a line that read badly: the crop at twice the size, and as a raw line with no layout analysis
+TESSERACT_LINE_RETRIES = [(2.0, '--oem 3 --psm 7'), (1.0, '--oem 3 --psm 13')]
+
+def line_crop(binary: np.ndarray, box: Tuple[int, int, int, int], scale: float = 1.0) -> np.ndarray:
+    """One line cut out of the page with a white margin, which Tesseract needs around the text"""
+    top, bottom, left, right = box
+    margin = max(4, (bottom - top) // 3)
+    crop = binary[max(top - 2, 0):bottom + 2, max(left - 2, 0):right + 2]
+    if scale != 1.0:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    return cv2.copyMakeBorder(crop, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=255)
+
+def extract_text_by_lines(processed: np.ndarray) -> Optional[str]:
+    """
+    Read a preprocessed receipt line by line: each line crop is a separate
+    --psm 7 Tesseract call in the process pool, and the text is put back
+    together in page order. Lines read below TESSERACT_LINE_CONFIDENCE are
+    retried on their own with TESSERACT_LINE_RETRIES, keeping the most
+    confident reading. Returns None when no lines are found.
+    """
+    processed = deskew_text(processed)
+    lines = find_text_lines(processed)
+    if not lines:
+        return None
+
+    from ocr_workers import run_tesseract_config
+    pool = get_tesseract_pool()
+    start = time.perf_counter()
+    # A box much taller than a typical line holds lines that could not be separated: read it as a block
+    line_height = float(np.median([bottom - top for top, bottom, _, _ in lines]))
+    configs = [TESSERACT_LINE_CONFIG if bottom - top <= line_height * 1.8 else TESSERACT_BLOCK_CONFIG
+               for top, bottom, _, _ in lines]
+    futures = [pool.submit(run_tesseract_config, line_crop(processed, box), config)
+               for box, config in zip(lines, configs)]
+    readings = []
+    for future in futures:
+        try:
+            _, text, confidence, word_count, _ = future.result()
+        except Exception as e:
+            print(f"Tesseract line failed: {e}")
+            text, confidence, word_count = '', 0.0, 0
+        readings.append((confidence if word_count else -1.0, text))
+
+    # Only the single lines that read badly go round again
+    threshold = app.config['TESSERACT_LINE_CONFIDENCE']
+    retries = {
+        index: [pool.submit(run_tesseract_config, line_crop(processed, lines[index], scale), config)
+                for scale, config in TESSERACT_LINE_RETRIES]
+        for index, (confidence, _) in enumerate(readings)
+        if confidence < threshold and configs[index] == TESSERACT_LINE_CONFIG
+    }
+    for index, retry_futures in retries.items():
+        for future in retry_futures:
+            try:
+                _, text, confidence, word_count, _ = future.result()
+            except Exception as e:
+                print(f"Tesseract line retry failed: {e}")
+                continue
+            if word_count and confidence > readings[index][0]:
+                readings[index] = (confidence, text)
+
+    seconds = time.perf_counter() - start
+    tesseract_pass_seconds.observe(seconds, config='lines')
+    record_timing('tesseract_lines', seconds)
+    print(f"📏 Tesseract read {len(lines)} lines ({len(retries)} retried) in {seconds:.2f}s")
+    return '\n'.join(text for _, text in readings if text.strip())
+
+@ocr_limiter.admit()
+@timed(engine_seconds, engine='tesseract')
+def extract_text_with_tesseract_enhanced(image) -> str:
     """
-    Enhanced Tesseract OCR with multiple configurations
+    Enhanced Tesseract OCR with multiple configurations.
+    The configurations are tried in order, TESSERACT_PASS_WINDOW at a time;
+    once a result reaches the confidence threshold no further passes are
+    started (passes already running in the pool cannot be stopped).
+    With TESSERACT_MODE 'lines' the receipt is read line by line instead
+    (falling back to the page passes when no lines are found).
     """
     try:
         # Preprocess image
-        processed_path = preprocess_image_advanced(image_path)
+        processed = preprocess_image_advanced(image)
+        if processed is None:
+            return ""
         
-        # Try different Tesseract configurations
-        configs = [
-            '--oem 3 --psm 6',  # Default
-            '--oem 3 --psm 8',  # Single word
-            '--oem 3 --psm 11', # Sparse text
-            '--oem 1 --psm 6',  # Legacy engine
-        ]
+        if app.config['TESSERACT_MODE'] == 'lines':
+            text = extract_text_by_lines(processed)
+            if text is not None:
+                return text
         
+        threshold = app.config['TESSERACT_CONFIDENCE_THRESHOLD']
+        min_words = app.config['TESSERACT_MIN_WORDS']
+        window = max(1, app.config['TESSERACT_PASS_WINDOW'])
         best_text = ""
-        best_confidence = 0
+        best_score = (False, -1.0)
         
-        for config in configs:
-            try:
-                text = pytesseract.image_to_string(processed_path, config=config)
-                # Simple confidence check based on text length and content
-                confidence = len([c for c in text if c.isalnum()]) / max(len(text), 1)
+        from ocr_workers import run_tesseract_config
+        pool = get_tesseract_pool()
+        pending_configs = list(TESSERACT_CONFIGS)
+        running = set()
+        while pending_configs or running:
+            while pending_configs and len(running) < window:
+                running.add(pool.submit(run_tesseract_config, processed, pending_configs.pop(0)))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            confident = False
+            for future in done:
+                try:
+                    config, text, confidence, word_count, seconds = future.result()
+                except Exception as e:
+                    print(f"Tesseract pass failed: {e}")
+                    continue
+                tesseract_pass_seconds.observe(seconds, config=config)
+                record_timing(f'tesseract_pass {config}', seconds)
                 
-                if confidence > best_confidence:
-                    best_confidence = confidence
+                # Mean word confidence, but a handful of confident words (e.g. psm 8
+                # reading a single word) never beats a result that read the receipt
+                score = (word_count >= min_words, confidence)
+                if score > best_score:
+                    best_score = score
                     best_text = text
-            except Exception as e:
-                print(f"Tesseract config {config} failed: {e}")
-                continue
-        
-        # Clean up processed image
-        if processed_path != image_path and os.path.exists(processed_path):
-            os.remove(processed_path)
+                
+                if word_count >= min_words and confidence >= threshold:
+                    confident = True
+                    print(f"✅ Tesseract {config} reached {confidence:.0f}% confidence, "
+                          f"skipping {len(pending_configs)} remaining passes")
+            if confident:
+                # Whatever is still running finishes in the pool; its result is not needed
+                break
         
         return best_text
     except Exception as e:
         print(f"Enhanced Tesseract extraction failed: {e}")
         return ""
 
-def extract_text_with_ocr(image_path: str) -> str:
+def extract_text_with_ocr(image, progress: Optional[Callable[[str], None]] = None,
+                          image_bytes: Optional[bytes] = None) -> str:
     """
-    Multi-method OCR extraction with fallbacks
+    Multi-method OCR extraction with fallbacks.
+    ``image_bytes`` (the original upload) is sent to Google Vision instead of re-encoding ``image``.
     """
+    progress = progress or (lambda message: None)
+
     # Try EasyOCR first (best for receipt text)
-    text = extract_text_with_easyocr(image_path)
+    progress('Trying EasyOCR')
+    text = extract_text_with_easyocr(image)
     if text.strip():
         print("✅ EasyOCR extraction successful")
         return text
     
     # Try Google Cloud Vision if available
-    text = extract_text_with_google_vision(image_path)
+    progress('EasyOCR found no text, trying Google Vision')
+    text = extract_text_with_google_vision(image_bytes if image_bytes is not None else image)
     if text.strip():
         print("✅ Google Vision extraction successful")
         return text
     
     # Fallback to enhanced Tesseract
-    text = extract_text_with_tesseract_enhanced(image_path)
+    progress('Google Vision found no text, trying Tesseract')
+    text = extract_text_with_tesseract_enhanced(image)
     if text.strip():
         print("✅ Enhanced Tesseract extraction successful")
         return text
     
     # Final fallback to basic Tesseract
+    progress('Enhanced Tesseract found no text, trying basic Tesseract')
     try:
-        text = pytesseract.image_to_string(image_path)
+        with ocr_limiter.admit(), timed(engine_seconds, engine='tesseract_basic'):
+            text = pytesseract.image_to_string(load_image(image))
         print("⚠️ Basic Tesseract extraction used")
         return text
     except Exception as e:
@@ -409,103 +1065,83 @@ def call_claude_ai_for_extraction(text: str) -> List[Dict[str, Any]]:
         print(f"Claude AI extraction failed: {e}")
         return extract_items_from_text_enhanced(text)
 
-def extract_items_from_text_enhanced(text: str) -> List[Dict[str, Any]]:
+# Lines mentioning any of these words are totals, payment details or headers, not items
+SKIP_WORDS = [
+    'total', 'subtotal', 'tax', 'vat', 'tip', 'receipt', 'thank you',
+    'date', 'time', 'server', 'table', 'order', 'bill', 'change',
+    'cash', 'credit', 'debit', 'visa', 'mastercard', 'amex',
+    'gratuity', 'service charge', 'balance', 'amount due',
+    'payment', 'card', 'terminal', 'reference', 'transaction',
+    'discount', 'disc', 'items sold'
+]
+# Matched at the start of a word, with common endings ("Taxes", "Totals", "Taxable", "Cashier") and
+# digits ("VISA1234") allowed after it, but not other letters ("Tipsy"); "Vegetable" has no match
+SKIP_LINE_RE = re.compile(r'\b(?:' + '|'.join(re.escape(word) for word in SKIP_WORDS) + r')(?:e?s|e?d|able|ier)?(?![a-z])',
+                          re.IGNORECASE)
+
+# A price column: optional currency symbol, then 12, 12.9, 12.99, 12,99 or, with the decimal point
+# read as a space by OCR, 12 99 (never the tail of a longer number)
+PRICE_PATTERN = r'(?<![\w.,$£€])[$£€]?\s?\d{1,4}(?:[.,]\d{1,2}|\s\d{2})?(?![\d.,])'
+# A unit price column always shows its decimals, so "Wings 9 99" is a 9.99 total, not 9 then 99
+UNIT_PRICE_PATTERN = r'(?<![\w.,$£€])[$£€]?\s?\d{1,4}[.,]\d{1,2}(?![\d.,])'
+
+# One receipt line: [quantity] name [unit price] line total [tax code]
+ITEM_LINE_RE = re.compile(r"""
+    ^(?:(?P<quantity>\d{1,3})\s*[x×]\s+          # "2 x Burger" / "2x Burger"
+      | (?P<bare_quantity>\d{1,3})\s+(?=\D))?    # "2 Burger"
+    (?P<name>.*?[^\W\d_].*?)                     # name, with at least one letter
+    (?:\s+@?\s*(?P<unit_price>""" + UNIT_PRICE_PATTERN + r"""))?   # optional unit price column
+    \s*[-–:]?\s*
+    (?P<line_total>""" + PRICE_PATTERN + r""")   # line total
+    (?:\s+[A-Z*]{1,2})?                          # trailing tax code, e.g. "A"
+    \s*$
+""", re.VERBOSE)
+
+def parse_price(text: str) -> Optional[float]:
+    """Turn '£12,99' / '$12.99' / '12 99' / '12' into a float"""
+    text = re.sub(r'(\d)\s+(\d{2})\s*$', r'\1.\2', text.strip())
+    try:
+        return float(re.sub(r'[^\d,.]', '', text).replace(',', '.'))
+    except ValueError:
+        return None
+
+@timed(stage_seconds, stage='parse')
+def extract_items_from_text_enhanced(text: str, max_items: Optional[int] = None) -> List[Dict[str, Any]]:
     """
-    Enhanced extraction using multiple regex patterns and validation
+    Extract items from receipt text in a single pass over the lines.
+    Each line is checked against one precompiled skip pattern and one item
+    grammar (quantity, name, unit price and line total columns), so long
+    receipts are parsed in linear time. The line total is used as the price.
     """
     items = []
+    seen_names = set()
     
-    # More comprehensive patterns for menu items and prices
-    patterns = [
-        r'(.+?)\s+(\$?\d+\.?\d*)',  # Item name followed by price
-        r'(\d+)\s*x\s*(.+?)\s+(\$?\d+\.?\d*)',  # Quantity x Item name Price
-        r'(.+?)\s*-\s*(\$?\d+\.?\d*)',  # Item name - Price
-        r'(.+?)\s+(\d+\.\d{2})',  # Item name with decimal price
-        r'(.+?)\s+(\d+)\.(\d{2})',  # Item name with separate decimal
-        r'(.+?)\s+(\d+,\d{2})',  # Item name with comma decimal
-        r'(.+?)\s+(\d+)\s*(\d{2})',  # Item name with space decimal
-    ]
-    
-    # Skip patterns for non-item lines
-    skip_patterns = [
-        r'total', r'subtotal', r'tax', r'tip', r'receipt', r'thank you',
-        r'date', r'time', r'server', r'table', r'order', r'bill', r'change',
-        r'cash', r'credit', r'debit', r'visa', r'mastercard', r'amex',
-        r'gratuity', r'service charge', r'balance', r'amount due', r'change',
-        r'payment', r'card', r'terminal', r'reference', r'transaction'
-    ]
-    
-    lines = text.split('\n')
-    for line in lines:
+    for line in text.split('\n'):
         line = line.strip()
-        if not line or len(line) < 3:
+        if len(line) < 3:
             continue
             
         # Skip lines that look like headers, totals, or non-item lines
-        if any(re.search(pattern, line.lower()) for pattern in skip_patterns):
+        if SKIP_LINE_RE.search(line):
             continue
             
-        # Try to match item patterns
-        for pattern in patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                if len(match.groups()) == 2:  # Item name and price
-                    name, price = match.groups()
-                    name = name.strip()
-                    price = re.sub(r'[^\d.]', '', price)  # Remove non-numeric chars
-                    
-                    if name and price and len(name) > 1:
-                        try:
-                            price_float = float(price)
-                            if 0.01 <= price_float <= 1000:  # Reasonable price range
-                                items.append({
-                                    'name': name.title(),
-                                    'price': price_float
-                                })
-                        except ValueError:
-                            continue
-                elif len(match.groups()) == 3:  # Quantity, item name, price or item name, decimal parts
-                    if 'x' in line.lower():  # Quantity x Item format
-                        qty, name, price = match.groups()
-                        name = name.strip()
-                        price = re.sub(r'[^\d.]', '', price)
-                        
-                        if name and price and len(name) > 1:
-                            try:
-                                price_float = float(price)
-                                if 0.01 <= price_float <= 1000:
-                                    items.append({
-                                        'name': f"{name.title()}",
-                                        'price': price_float
-                                    })
-                            except ValueError:
-                                continue
-                    else:  # Decimal parts format
-                        name, whole, decimal = match.groups()
-                        name = name.strip()
-                        price = f"{whole}.{decimal}"
-                        
-                        if name and len(name) > 1:
-                            try:
-                                price_float = float(price)
-                                if 0.01 <= price_float <= 1000:
-                                    items.append({
-                                        'name': name.title(),
-                                        'price': price_float
-                                    })
-                            except ValueError:
-                                continue
-                break
-    
-    # Remove duplicates and sort by price
-    unique_items = []
-    seen_names = set()
-    for item in items:
-        if item['name'] not in seen_names:
-            unique_items.append(item)
-            seen_names.add(item['name'])
+        match = ITEM_LINE_RE.match(line)
+        if not match:
+            continue
+        
+        name = match.group('name').strip(' \t.-:$£€').title()
+        price = parse_price(match.group('line_total'))
+        if len(name) < 2 or price is None or not 0.01 <= price <= 1000:  # Reasonable price range
+            continue
+        
+        # Keep the first occurrence of each item name
+        if name in seen_names:
+            continue
+        seen_names.add(name)
+        items.append({'name': name, 'price': price})
     
-    return sorted(unique_items, key=lambda x: x['price'], reverse=True)[:20]  # Limit to 20 items max
+    items.sort(key=lambda x: x['price'], reverse=True)
+    return items[:max_items] if max_items else items
 
 def extract_items_from_text(text: str) -> List[Dict[str, Any]]:
     """
@@ -520,177 +1156,686 @@ def index():
 
 @app.route('/api/members', methods=['GET'])
 def get_members():
-    """Get saved members"""
-    members = load_saved_members()
+    """Get saved members (of the default group, or ?group=<name>)"""
+    members = load_saved_members(request.args.get('group', DEFAULT_GROUP))
     return jsonify({'members': members})
 
 @app.route('/api/members', methods=['POST'])
 def save_members_api():
-    """Save members"""
+    """Save members (of the default group, or the body's 'group')"""
     try:
         data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         members = data.get('members', [])
-        save_members(members)
+        if not isinstance(members, list):
+            return jsonify({'error': 'members must be a list'}), 400
+        save_members(members, data.get('group', DEFAULT_GROUP))
         return jsonify({'success': True, 'message': 'Members saved successfully'})
     except Exception as e:
         return jsonify({'error': f'Failed to save members: {str(e)}'}), 500
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    """Handle bill image upload and text extraction"""
+@app.route('/api/groups', methods=['GET'])
+def list_groups():
+    """Every saved group with its member count"""
+    return jsonify({'groups': member_store.list_groups()})
+
+@app.route('/api/groups/<group>', methods=['GET'])
+def get_group(group):
+    """A group's members"""
+    if not member_store.group_exists(group):
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify({'group': group, 'members': member_store.get_members(group)})
+
+@app.route('/api/groups/<group>', methods=['PUT', 'PATCH'])
+def update_group(group):
+    """
+    PUT {"members": [...]} replaces a group's members (creating the group);
+    PATCH {"add": [...], "remove": [...]} changes them in one transaction
+    """
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    try:
+        if request.method == 'PUT':
+            if not isinstance(data.get('members'), list):
+                return jsonify({'error': 'members must be a list'}), 400
+            members = member_store.set_members(data['members'], group)
+        else:
+            add, remove = data.get('add', []), data.get('remove', [])
+            if not isinstance(add, list) or not isinstance(remove, list):
+                return jsonify({'error': 'add and remove must be lists'}), 400
+            members = member_store.update_members(add, remove, group)
+    except Exception as e:
+        return jsonify({'error': f'Failed to save members: {str(e)}'}), 500
+    return jsonify({'group': group, 'members': members})
+
+@app.route('/api/groups/<group>', methods=['DELETE'])
+def delete_group(group):
+    """Delete a group and its members"""
+    if not member_store.delete_group(group):
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify({'success': True})
+
+SAMPLE_ITEMS = [
+    {'name': 'Caesar Salad', 'price': 12.99},
+    {'name': 'Grilled Chicken', 'price': 18.50},
+    {'name': 'Pasta Carbonara', 'price': 16.75},
+    {'name': 'Garlic Bread', 'price': 6.50},
+    {'name': 'Chocolate Cake', 'price': 8.99}
+]
+
+def race_engine_runners(image, image_bytes: bytes) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    """
+    One callable per raceable engine, each returning a result dict like
+    run_extraction_chain ('items' may be empty when the engine found nothing usable)
+    """
+    def gemini():
+        return {'items': extract_text_with_gemini(image), 'method': 'gemini', 'extracted_text': ''}
+
+    def from_text(extract):
+        def run():
+            text = extract()
+            items = call_claude_ai_for_extraction(text) if text.strip() else []
+            return {'items': items, 'method': 'ocr', 'extracted_text': text}
+        return run
+
+    return {
+        'gemini': gemini,
+        'easyocr': from_text(lambda: extract_text_with_easyocr(image)),
+        'google_vision': from_text(lambda: extract_text_with_google_vision(image_bytes)),
+        'tesseract': from_text(lambda: extract_text_with_tesseract_enhanced(image)),
+    }
+
+_race_pool = None
+
+def get_race_pool() -> ThreadPoolExecutor:
+    """
+    Threads for racing engines: room for every engine of every extraction that can run at
+    once (/upload requests, bulk upload threads and background job workers)
+    """
+    global _race_pool
+    with _pool_lock:
+        if _race_pool is None:
+            callers = app.config['UPLOAD_LIMIT'] + app.config['BULK_WORKERS'] + app.config['EXTRACTION_WORKERS']
+            size = callers * max(len(app.config['EXTRACTION_RACE_ENGINES']), 1)
+            _race_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='extraction-race')
+        return _race_pool
+
+def run_extraction_race(image, image_bytes: bytes,
+                        progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Launch every configured engine at once and take the first result with items.
+
+    Engines are listed best first in EXTRACTION_RACE_ENGINES. With the
+    'prefer_quality' policy, a result from a lower-ranked engine waits up to
+    EXTRACTION_RACE_GRACE seconds for a better-ranked engine that is still
+    running. Engines that run past their deadline (EXTRACTION_ENGINE_DEADLINES,
+    counted from when the engine starts, not from when it was queued) are
+    ignored. Returns the winning result, or the best text seen with no items.
+    """
+    progress = progress or (lambda message: None)
+    runners = race_engine_runners(image, image_bytes)
+    engines = [name for name in app.config['EXTRACTION_RACE_ENGINES'] if name in runners]
+    rank = {name: position for position, name in enumerate(engines)}
+    start = time.monotonic()
+    # Set by each engine's thread as it starts running
+    deadlines: Dict[str, float] = {}
+
+    def run_engine(name):
+        deadlines[name] = time.monotonic() + app.config['EXTRACTION_ENGINE_DEADLINES'].get(name, 30.0)
+        return runners[name]()
+
+    progress(f"Racing {', '.join(engines)}")
+    # Each engine thread gets a copy of this context, so its timings land in this request's breakdown
+    futures = {get_race_pool().submit(contextvars.copy_context().run, run_engine, name): name for name in engines}
+    pending = set(futures)
+    best, best_name = None, None
+    fallback_text = ''
+    grace_until = None
+
+    try:
+        while pending:
+            now = time.monotonic()
+            # Drop engines that ran out of time
+            for future in [f for f in pending if deadlines.get(futures[f], now + 1) <= now]:
+                pending.discard(future)
+                future.cancel()
+                progress(f"{futures[future]} missed its deadline")
+            if not pending:
+                break
+
+            # Stop once nothing better-ranked than the current best can still arrive
+            if best is not None:
+                better_pending = [f for f in pending if rank[futures[f]] < rank[best_name]]
+                if not better_pending or app.config['EXTRACTION_RACE_POLICY'] != 'prefer_quality':
+                    break
+                if grace_until is None:
+                    grace_until = now + app.config['EXTRACTION_RACE_GRACE']
+                    progress(f"{best_name} finished first, waiting up to "
+                             f"{app.config['EXTRACTION_RACE_GRACE']:g}s for a better engine")
+                if now >= grace_until:
+                    break
+
+            # An engine still queued has no deadline yet; look again shortly in case it starts
+            timeout = min(deadlines.get(futures[f], now + 0.1) for f in pending) - now
+            if grace_until is not None:
+                timeout = min(timeout, grace_until - now)
+            done, pending = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+
+            for future in sorted(done, key=lambda f: rank[futures[f]]):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    progress(f"{name} failed: {e}")
+                    continue
+                if not result['items']:
+                    progress(f"{name} found no items")
+                    if len(result.get('extracted_text', '')) > len(fallback_text):
+                        fallback_text = result['extracted_text']
+                    continue
+                if best is None or rank[name] < rank[best_name]:
+                    best, best_name = result, name
+                    progress(f"{name} found {len(result['items'])} items")
+    finally:
+        # Whatever is still running is left to finish in the background and ignored
+        for future in pending:
+            future.cancel()
+
+    if best is None:
+        return {'items': [], 'method': 'ocr', 'extracted_text': fallback_text}
+    print(f"🏁 {best_name} won the extraction race in {time.monotonic() - start:.2f}s")
+    best['engine'] = best_name
+    return best
+
+def run_extraction_chain(image_bytes: bytes, progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Run Gemini, then OCR + text processing, on an uploaded image.
+    The image is decoded once and the array is shared by every stage.
+    Returns a dict with 'items', 'method' ('gemini', 'ocr' or 'sample') and 'extracted_text'.
+    """
+    progress = progress or (lambda message: None)
+
+    with decode_limiter.admit(), timed(stage_seconds, stage='decode'):
+        image = decode_image(image_bytes, reduce=app.config['REDUCED_DECODE']
+                             and app.config['PREPROCESS_MODE'] != 'quality')
+    if image is None:
+        raise ValueError('Could not decode image')
+
+    if app.config['EXTRACTION_MODE'] == 'race':
+        result = run_extraction_race(image, image_bytes, progress)
+        if result['items']:
+            return result
+        progress('No engine found any items, using sample data')
+        extracted_text = result['extracted_text']
+        return {'items': [dict(item) for item in SAMPLE_ITEMS], 'method': 'sample',
+                'extracted_text': extracted_text if extracted_text.strip() else 'OCR extraction failed - using sample data'}
+
+    # Try Gemini Vision API first (best for receipt parsing)
+    progress('Trying Gemini')
+    extracted_items = extract_text_with_gemini(image)
+    if extracted_items:
+        return {'items': extracted_items, 'method': 'gemini', 'extracted_text': ''}
+
+    # Fallback to OCR + text processing
+    print("🔄 Gemini failed, trying OCR methods...")
+    progress('Gemini failed, trying OCR')
+    with timed(stage_seconds, stage='ocr'):
+        extracted_text = extract_text_with_ocr(image, progress, image_bytes=image_bytes)
+    if not extracted_text.strip():
+        progress('OCR found no text, using sample data')
+        # If OCR fails, return sample data for demo
+        return {'items': [dict(item) for item in SAMPLE_ITEMS], 'method': 'sample',
+                'extracted_text': 'OCR extraction failed - using sample data'}
+
+    # Use Claude AI (or enhanced extraction) to process the text
+    progress('Parsing items from OCR text')
+    extracted_items = call_claude_ai_for_extraction(extracted_text)
+    if extracted_items:
+        return {'items': extracted_items, 'method': 'ocr', 'extracted_text': extracted_text}
+
+    # Fallback to sample data if no items extracted
+    progress('No items found in OCR text, using sample data')
+    return {'items': [dict(item) for item in SAMPLE_ITEMS], 'method': 'sample',
+            'extracted_text': extracted_text}
+
+def build_upload_response(result: Dict[str, Any], cached: bool = False) -> Dict[str, Any]:
+    """Assign every item to all saved members and attach totals to an extraction result"""
+    extracted_items = result['items']
+    method = result['method']
+    extracted_text = result.get('extracted_text', '')
+
+    # Load saved members
+    members = load_saved_members()
+
+    # Set equal split by default (all members selected for all items)
+    for item in extracted_items:
+        item['assignedTo'] = members.copy()
+
+    # Calculate totals
+    totals = calculate_totals(members, extracted_items)
+
+    if method == 'gemini':
+        message = f'🎯 Gemini AI successfully extracted {len(extracted_items)} items from your bill!'
+    elif method == 'ocr':
+        message = f'Successfully extracted {len(extracted_items)} items from your bill!'
+    elif extracted_text == 'OCR extraction failed - using sample data':
+        message = 'OCR extraction failed. Using sample data for demo.'
+    else:
+        message = 'No items could be extracted. Using sample data for demo.'
+    if cached:
+        message += ' (cached)'
+
+    response = {
+        'items': extracted_items,
+        'message': message,
+        'method': method,
+        'engine': result.get('engine', method),
+        'cached': cached,
+        'members': members,
+        'totals': totals
+    }
+    if method != 'gemini':
+        response['extracted_text'] = extracted_text[:500] + '...' if len(extracted_text) > 500 else extracted_text
+    return response
+
+def process_upload(image_bytes: bytes, filename: str,
+                   progress: Optional[Callable[[str], None]] = None,
+                   include_timings: bool = False) -> Dict[str, Any]:
+    """
+    Extract items from an uploaded image (using the extraction cache) and build the response.
+    With ``include_timings`` the response carries a 'timings' breakdown in milliseconds per stage.
+    """
+    progress = progress or (lambda message: None)
+
+    with collect_timings() as breakdown, timed(stage_seconds, stage='upload'):
+        # Same photo (or a recompressed copy) seen before: skip extraction entirely
+        with timed(stage_seconds, stage='cache_lookup'):
+            cache_keys = extraction_cache.keys_for(image_bytes)
+            cached_result = extraction_cache.lookup(cache_keys)
+        if cached_result:
+            print("⚡ Extraction cache hit")
+            progress('Found in extraction cache')
+            result, cached = cached_result, True
+        else:
+            # The upload stays in memory; it is only written out when debugging
+            save_debug_image(image_bytes, filename)
+
+            with timed(stage_seconds, stage='extraction'):
+                result = run_extraction_chain(image_bytes, progress)
+            engine_wins_total.inc(engine=result.get('engine', result['method']))
+
+            # Sample data is a failure, so let the next upload try again
+            if result['method'] != 'sample':
+                extraction_cache.store(cache_keys, result)
+            cached = False
+
+        uploads_total.inc(method=result['method'], cached=str(cached).lower())
+        response = build_upload_response(result, cached=cached)
+
+    if include_timings:
+        response['timings'] = breakdown.as_milliseconds()
+    return response
+
+def run_upload_job(job) -> Dict[str, Any]:
+    """Worker entry point for a queued upload"""
+    return process_upload(job.payload['image_bytes'], job.payload['filename'], job.report,
+                          include_timings=job.payload.get('include_timings', False))
+
+# Background extraction workers; this caps the number of receipts in flight
+app.config['EXTRACTION_WORKERS'] = int(os.getenv('NBS_EXTRACTION_WORKERS', '2'))
+app.config['EXTRACTION_MAX_PENDING'] = int(os.getenv('NBS_EXTRACTION_MAX_PENDING', '32'))
+extraction_jobs = ExtractionJobQueue(
+    run_upload_job,
+    max_workers=app.config['EXTRACTION_WORKERS'],
+    max_pending=app.config['EXTRACTION_MAX_PENDING'],
+)
+
+# Bulk uploads: the receipts of one request are processed in parallel
+app.config['BULK_WORKERS'] = int(os.getenv('NBS_BULK_WORKERS', str(os.cpu_count() or 2)))
+app.config['BULK_MAX_FILES'] = int(os.getenv('NBS_BULK_MAX_FILES', '50'))
+app.config['BULK_MAX_CONTENT_LENGTH'] = int(os.getenv('NBS_BULK_MAX_MB', '200')) * 1024 * 1024
+
+_bulk_pool = None
+
+def get_bulk_pool() -> ThreadPoolExecutor:
+    """Threads for bulk uploads, created on first use (OCR itself runs in the Tesseract process pool)"""
+    global _bulk_pool
+    with _pool_lock:
+        if _bulk_pool is None:
+            _bulk_pool = ThreadPoolExecutor(max_workers=app.config['BULK_WORKERS'], thread_name_prefix='bulk-upload')
+        return _bulk_pool
+
+def receipt_summary(index: int, filename: str, response: Dict[str, Any]) -> Dict[str, Any]:
+    """One receipt of a bulk upload: the /upload response without the per-receipt split"""
+    summary = {key: value for key, value in response.items() if key not in ('members', 'totals')}
+    summary.update({'type': 'receipt', 'index': index, 'filename': filename,
+                    'subtotal': response['totals']['subtotal']})
+    return summary
+
+def process_bulk_upload(files: Iterable) -> Iterator[Dict[str, Any]]:
+    """
+    Process uploaded receipts in parallel, yielding each receipt's result as it finishes
+    (in completion order, with its 'index') and finally the combined bill: every extracted
+    item, tagged with its receipt, split between the saved members. A receipt no engine could
+    read counts as failed rather than contributing the sample items.
+    Files are only read once a worker is about to be free, so at most 2 x BULK_WORKERS
+    images are held in memory at a time.
+    """
+    pool = get_bulk_pool()
+    max_in_flight = app.config['BULK_WORKERS'] * 2
+    in_flight = {}
+    items_by_receipt = {}
+    failed = 0
+
+    def finished(future):
+        nonlocal failed
+        index, filename = in_flight.pop(future)
+        try:
+            response = future.result()
+        except Exception as e:
+            failed += 1
+            return {'type': 'receipt', 'index': index, 'filename': filename,
+                    'error': f'Failed to process image: {str(e)}'}
+        if response['method'] == 'sample':
+            # Every engine failed; the demo items must not end up in the combined bill
+            failed += 1
+            return {'type': 'receipt', 'index': index, 'filename': filename,
+                    'error': 'No items could be read from this receipt'}
+        items_by_receipt[index] = [dict(item, receipt=filename) for item in response['items']]
+        return receipt_summary(index, filename, response)
+
+    for index, file in enumerate(files):
+        if not file.filename or not allowed_file(file.filename):
+            failed += 1
+            yield {'type': 'receipt', 'index': index, 'filename': file.filename, 'error': 'Invalid file type'}
+            continue
+        while len(in_flight) >= max_in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finished(future)
+        try:
+            image_bytes = ingest_image(file.stream)
+        except UploadRejected as e:
+            failed += 1
+            yield {'type': 'receipt', 'index': index, 'filename': file.filename, 'error': str(e)}
+            continue
+        finally:
+            file.close()
+        in_flight[pool.submit(process_upload, image_bytes, file.filename)] = (index, file.filename)
+
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield finished(future)
+
+    members = load_saved_members()
+    items = [item for index in sorted(items_by_receipt) for item in items_by_receipt[index]]
+    for item in items:
+        item['assignedTo'] = members.copy()
+    yield {
+        'type': 'bill',
+        'receipts': len(items_by_receipt),
+        'failed': failed,
+        'items': items,
+        'members': members,
+        'totals': calculate_totals(members, items),
+    }
+
+def detach_uploads(files: List[FileStorage]) -> List[FileStorage]:
+    """
+    Take uploaded files away from the request, which closes its own files as soon as the
+    view returns, so a streamed response can still read them (the reader closes them)
+    """
+    detached = []
+    for file in files:
+        detached.append(FileStorage(file.stream, filename=file.filename, name=file.name,
+                                    content_type=file.content_type, headers=file.headers))
+        file.stream = io.BytesIO()
+    return detached
+
+def read_image_upload():
+    """
+    The uploaded image as (bytes, filename), from a multipart 'file' field or from a raw
+    image request body (Content-Type image/*, name in ?filename=). A raw body is read
+    straight off the connection, so a bad upload is rejected before the rest arrives.
+    Raises UploadRejected.
+    """
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        if request.content_length and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+            raise UploadRejected(f"Image is larger than {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)}MB", 413)
+        return ingest_image(request.stream), request.args.get('filename') or 'upload'
+
     if 'file' not in request.files:
-        return jsonify({'error': 'No file uploaded'}), 400
-    
+        raise UploadRejected('No file uploaded')
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
-    
-    if file and allowed_file(file.filename):
-        try:
-            # Save uploaded file temporarily
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-            filename = timestamp + filename
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Try Gemini Vision API first (best for receipt parsing)
-            extracted_items = extract_text_with_gemini(filepath)
-            
-            if extracted_items:
-                # Clean up the temporary file
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                
-                # Load saved members
-                members = load_saved_members()
-                
-                # Set equal split by default (all members selected for all items)
-                for item in extracted_items:
-                    item['assignedTo'] = members.copy()
-                
-                # Calculate totals
-                totals = calculate_totals(members, extracted_items)
-                
-                return jsonify({
-                    'items': extracted_items,
-                    'message': f'🎯 Gemini AI successfully extracted {len(extracted_items)} items from your bill!',
-                    'method': 'gemini',
-                    'members': members,
-                    'totals': totals
-                })
-            
-            # Fallback to OCR + text processing
-            print("🔄 Gemini failed, trying OCR methods...")
-            extracted_text = extract_text_with_ocr(filepath)
-            
-            if not extracted_text.strip():
-                # If OCR fails, return sample data for demo
-                sample_items = [
-                    {'name': 'Caesar Salad', 'price': 12.99},
-                    {'name': 'Grilled Chicken', 'price': 18.50},
-                    {'name': 'Pasta Carbonara', 'price': 16.75},
-                    {'name': 'Garlic Bread', 'price': 6.50},
-                    {'name': 'Chocolate Cake', 'price': 8.99}
-                ]
-                
-                # Load saved members
-                members = load_saved_members()
-                
-                # Set equal split by default
-                for item in sample_items:
-                    item['assignedTo'] = members.copy()
-                
-                # Calculate totals
-                totals = calculate_totals(members, sample_items)
-                
-                # Clean up the temporary file
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                
-                return jsonify({
-                    'items': sample_items,
-                    'message': 'OCR extraction failed. Using sample data for demo.',
-                    'extracted_text': 'OCR extraction failed - using sample data',
-                    'method': 'sample',
-                    'members': members,
-                    'totals': totals
-                })
-            
-            # Use Claude AI (or enhanced extraction) to process the text
-            extracted_items = call_claude_ai_for_extraction(extracted_text)
-            
-            # Load saved members
-            members = load_saved_members()
-            
-            # Set equal split by default
-            for item in extracted_items:
-                item['assignedTo'] = members.copy()
-            
-            # Calculate totals
-            totals = calculate_totals(members, extracted_items)
-            
-            # Clean up the temporary file
+        raise UploadRejected('No file selected')
+    if not allowed_file(file.filename):
+        raise UploadRejected('Invalid file type')
+    return ingest_image(file.stream), file.filename
+
+def wants_timings() -> bool:
+    """Whether the client asked for a per-stage timing breakdown (?timings=1)"""
+    return request.args.get('timings', '').lower() in ('1', 'true', 'yes')
+
+def busy_response(message: str, retry_after: float):
+    """429 with a Retry-After header (whole seconds)"""
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({'error': f'Server busy: {message}', 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def check_rate_limit(uploads: int = 1):
+    """A 429 response if the client has used up its uploads for now, otherwise None"""
+    wait_seconds = rate_limiter.acquire(request.remote_addr or 'unknown', uploads)
+    if wait_seconds:
+        return busy_response('too many uploads, please slow down', wait_seconds)
+    return None
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    """Handle bill image upload and text extraction"""
+    limited = check_rate_limit()
+    if limited:
+        return limited
+
+    # Wait for a slot before reading the image, so queued uploads hold no image in memory
+    try:
+        with upload_limiter.admit():
             try:
-                os.remove(filepath)
-            except:
-                pass
-            
-            if extracted_items:
-                return jsonify({
-                    'items': extracted_items,
-                    'message': f'Successfully extracted {len(extracted_items)} items from your bill!',
-                    'extracted_text': extracted_text[:500] + '...' if len(extracted_text) > 500 else extracted_text,
-                    'method': 'ocr',
-                    'members': members,
-                    'totals': totals
-                })
+                image_bytes, filename = read_image_upload()
+            except UploadRejected as e:
+                return jsonify({'error': str(e)}), e.status
+
+            try:
+                return jsonify(process_upload(image_bytes, filename, include_timings=wants_timings()))
+            except Exception as e:
+                return jsonify({'error': f'Failed to process image: {str(e)}'}), 500
+    except Overloaded as e:
+        return busy_response(str(e), e.retry_after)
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_files_bulk():
+    """
+    Process several bill images ('files' fields) in parallel and combine them into one bill.
+    Returns {"receipts": [...], "bill": {...}}; with ?stream=1 (or Accept: application/x-ndjson)
+    each receipt is streamed as an NDJSON line as soon as it finishes, followed by the bill.
+    """
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    if len(files) > app.config['BULK_MAX_FILES']:
+        return jsonify({'error': f"At most {app.config['BULK_MAX_FILES']} files per upload"}), 400
+    limited = check_rate_limit(len(files))
+    if limited:
+        return limited
+
+    stream = (request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+    if stream:
+        files = detach_uploads(files)
+        def generate():
+            for result in process_bulk_upload(files):
+                yield json.dumps(result) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    try:
+        results = list(process_bulk_upload(files))
+    except Exception as e:
+        return jsonify({'error': f'Failed to process images: {str(e)}'}), 500
+    receipts = sorted(results[:-1], key=lambda result: result['index'])
+    return jsonify({'receipts': receipts, 'bill': results[-1]})
+
+@app.route('/api/jobs', methods=['POST'])
+def create_upload_job():
+    """
+    Queue a bill image for extraction and return a job id immediately.
+    With ?stream=1 (or Accept: application/x-ndjson) the response instead streams NDJSON:
+    the job, its progress events, then the finished job with its result. Unlike following
+    events_url, this works when the server runs several worker processes.
+    """
+    limited = check_rate_limit()
+    if limited:
+        return limited
+
+    try:
+        # Turn the upload away before reading it when the queue is already full
+        extraction_jobs.check_capacity()
+        try:
+            image_bytes, filename = read_image_upload()
+        except UploadRejected as e:
+            return jsonify({'error': str(e)}), e.status
+        job = extraction_jobs.submit({'image_bytes': image_bytes, 'filename': filename,
+                                      'include_timings': wants_timings()})
+    except QueueFullError as e:
+        return busy_response(str(e), extraction_jobs.retry_after())
+
+    stream = (request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+    if stream:
+        def generate():
+            yield json.dumps({'type': 'job', 'job_id': job.id, 'status': job.status}) + '\n'
+            for event in extraction_jobs.stream_events(job):
+                # A blank line keeps the connection alive while nothing happens
+                yield '\n' if event is None else json.dumps(dict(event, type='progress')) + '\n'
+            yield json.dumps(dict(job.to_dict(), type=job.status)) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events'
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Job status, progress messages and (once done) the upload result"""
+    job = extraction_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_upload_job(job_id):
+    """Server-sent events with job progress, ending with a 'done' or 'failed' event"""
+    job = extraction_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        for event in extraction_jobs.stream_events(job):
+            if event is None:
+                yield ': keep-alive\n\n'
             else:
-                # Fallback to sample data if no items extracted
-                sample_items = [
-                    {'name': 'Caesar Salad', 'price': 12.99},
-                    {'name': 'Grilled Chicken', 'price': 18.50},
-                    {'name': 'Pasta Carbonara', 'price': 16.75},
-                    {'name': 'Garlic Bread', 'price': 6.50},
-                    {'name': 'Chocolate Cake', 'price': 8.99}
-                ]
-                
-                # Set equal split by default
-                for item in sample_items:
-                    item['assignedTo'] = members.copy()
-                
-                # Calculate totals
-                totals = calculate_totals(members, sample_items)
-                
-                return jsonify({
-                    'items': sample_items,
-                    'message': 'No items could be extracted. Using sample data for demo.',
-                    'extracted_text': extracted_text[:500] + '...' if len(extracted_text) > 500 else extracted_text,
-                    'method': 'sample',
-                    'members': members,
-                    'totals': totals
-                })
-            
-        except Exception as e:
-            return jsonify({'error': f'Failed to process image: {str(e)}'}), 500
+                yield f'event: progress\ndata: {json.dumps(event)}\n\n'
+        yield f'event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n'
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Extraction cache statistics"""
+    return jsonify(extraction_cache.stats())
+
+@app.route('/api/backends', methods=['GET'])
+def backend_status():
+    """Circuit breaker state of each remote extraction backend"""
+    return jsonify({name: backend.status() for name, backend in remote_backends.items()})
+
+@app.route('/api/admission', methods=['GET'])
+def admission_status():
+    """Running, queued and rejected requests per stage, the job queue and the per-client rate limit"""
+    return jsonify(admission_stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms, extraction outcomes and cache hit rates in Prometheus format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/engines', methods=['GET'])
+def engine_stats():
+    """Load state, load time and memory of each OCR engine"""
+    return jsonify(ocr_engines.stats())
+
+def parse_bill(data: Dict[str, Any]):
+    """
+    Pull (members, items, discount_percent) out of a /calculate request body.
+    Raises ValueError when the bill is not an object or members or items are missing.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('A bill must be a JSON object')
+    members = data.get('members', [])
+    items = data.get('items', [])
+    discount_percent = float(data.get('discount', 0))
     
-    return jsonify({'error': 'Invalid file type'}), 400
+    if not members or not items:
+        raise ValueError('Members and items are required')
+    return members, items, discount_percent
+
+def calculate_totals_batch(bills):
+    """
+    Calculate each bill in an iterable of /calculate request bodies.
+    Yields one result per bill, with 'index' set and 'error' instead of totals for a bad bill,
+    so callers can stream results without holding the whole batch.
+    """
+    for index, data in enumerate(bills):
+        try:
+            if isinstance(data, ValueError):
+                raise data
+            members, items, discount_percent = parse_bill(data)
+            result = calculate_totals(members, items, discount_percent)
+        except Exception as e:
+            result = {'error': str(e)}
+        result['index'] = index
+        yield result
+
+def read_ndjson_bills(stream):
+    """
+    Parse bills one line at a time from an NDJSON request body.
+    A line that is not valid JSON is yielded as a ValueError, so only that bill fails.
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f'Invalid JSON: {e}')
 
 @app.route('/calculate', methods=['POST'])
 def calculate_split():
     """Calculate bill split based on member assignments"""
     try:
         data = request.json
-        members = data.get('members', [])
-        items = data.get('items', [])
-        discount_percent = float(data.get('discount', 0))
-        
-        if not members or not items:
-            return jsonify({'error': 'Members and items are required'}), 400
+        try:
+            members, items, discount_percent = parse_bill(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Calculate totals
         totals = calculate_totals(members, items, discount_percent)
@@ -700,5 +1845,217 @@ def calculate_split():
     except Exception as e:
         return jsonify({'error': f'Calculation failed: {str(e)}'}), 500
 
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_split_batch():
+    """
+    Calculate many bills in one request.
+    Body: {"bills": [<same body as /calculate>, ...]}, or one bill per line with
+    Content-Type application/x-ndjson. With ?stream=1 (or Accept: application/x-ndjson)
+    results are streamed back as NDJSON, one line per bill, in order.
+    """
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            bills = read_ndjson_bills(request.stream)
+        else:
+            data = request.json
+            bills = data.get('bills') if isinstance(data, dict) else None
+            if not isinstance(bills, list):
+                return jsonify({'error': 'A list of bills is required'}), 400
+
+        stream = (request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        if stream:
+            def generate():
+                for result in calculate_totals_batch(bills):
+                    yield json.dumps(result) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        results = list(calculate_totals_batch(bills))
+        return jsonify({
+            'results': results,
+            'count': len(results),
+            'errors': sum(1 for result in results if 'error' in result)
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Calculation failed: {str(e)}'}), 500
+
+@app.route('/api/bills', methods=['POST'])
+def create_bill_session():
+    """
+    Start a server-side bill session; returns its id and the full totals.
+    Later changes are sent as small deltas to /api/bills/<bill_id>/deltas.
+    """
+    try:
+        try:
+            members, items, discount_percent = parse_bill(request.json)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        session = bill_sessions.create(members, items, discount_percent)
+        with session.lock:
+            result = session.totals()
+            result.update({'bill_id': session.id, 'version': session.version})
+        return jsonify(result), 201
+        
+    except Exception as e:
+        return jsonify({'error': f'Calculation failed: {str(e)}'}), 500
+
+@app.route('/api/bills/<bill_id>', methods=['GET'])
+def get_bill_session(bill_id):
+    """Full totals of a bill session"""
+    session = bill_sessions.get(bill_id)
+    if session is None:
+        return jsonify({'error': 'Bill not found'}), 404
+    with session.lock:
+        result = session.totals()
+        result.update({'bill_id': session.id, 'version': session.version})
+    return jsonify(result)
+
+@app.route('/api/bills/<bill_id>/deltas', methods=['POST'])
+def update_bill_session(bill_id):
+    """
+    Apply deltas to a bill session, e.g.
+    {"deltas": [{"op": "toggle", "item": 2, "member": "Sam"}]}.
+    Returns the bill summary and only the member totals that changed.
+    """
+    session = bill_sessions.get(bill_id)
+    if session is None:
+        return jsonify({'error': 'Bill not found'}), 404
+
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    deltas = data.get('deltas', [data] if 'op' in data else [])
+    if not isinstance(deltas, list) or not all(isinstance(delta, dict) for delta in deltas):
+        return jsonify({'error': 'deltas must be a list of objects'}), 400
+    try:
+        with session.lock:
+            changed = session.apply(deltas)
+            result = session.totals(changed)
+            result.update({'bill_id': session.id, 'version': session.version})
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid delta: {str(e)}'}), 400
+    return jsonify(result)
+
+def parse_date(value: Optional[str]) -> Optional[float]:
+    """Timestamp of an ISO 8601 date or datetime (None passes through); raises ValueError"""
+    if value is None or value == '':
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/history', methods=['POST'])
+def save_bill():
+    """
+    Calculate a bill and save it to the history.
+    Body: the /calculate body plus optional "group", "title", "date" (ISO 8601) and
+    "paid_by" (a member name, or {"member": amount} for a split payment).
+    """
+    try:
+        data = request.json or {}
+        try:
+            members, items, discount_percent = parse_bill(data)
+            created = parse_date(data.get('date'))
+            totals = calculate_totals(members, items, discount_percent)
+            bill_id, _ = bill_history.add_bill(
+                items, totals, group=data.get('group', DEFAULT_GROUP), paid_by=data.get('paid_by'),
+                title=str(data.get('title', '')), created=created
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        totals['id'] = bill_id
+        return jsonify(totals), 201
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to save bill: {str(e)}'}), 500
+
+@app.route('/api/history', methods=['GET'])
+def list_saved_bills():
+    """
+    Saved bills, newest first. Filters: ?group=, ?member=, ?since= and ?until= (ISO dates).
+    Pages of ?limit= bills (default 20, at most 100); pass ?cursor=<next_cursor> for the next page.
+    """
+    try:
+        page = bill_history.list_bills(
+            group=request.args.get('group'), member=request.args.get('member'),
+            since=parse_date(request.args.get('since')), until=parse_date(request.args.get('until')),
+            limit=request.args.get('limit', 20), cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+    return jsonify(page)
+
+@app.route('/api/history/<int:bill_id>', methods=['GET'])
+def get_saved_bill(bill_id):
+    """A saved bill with its items, assignments and member totals"""
+    bill = bill_history.get_bill(bill_id)
+    if bill is None:
+        return jsonify({'error': 'Bill not found'}), 404
+    return jsonify(bill)
+
+@app.route('/api/history/<int:bill_id>', methods=['DELETE'])
+def delete_saved_bill(bill_id):
+    """Delete a saved bill (its amounts are taken out of the balances)"""
+    if bill_history.delete_bill(bill_id) is None:
+        return jsonify({'error': 'Bill not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/balances', methods=['GET'])
+def get_balances():
+    """Running paid / owed / balance per member across a group's saved bills (?group=)"""
+    group = request.args.get('group', DEFAULT_GROUP)
+    return jsonify({'group': group, 'balances': bill_history.balances(group)})
+
+@app.route('/api/settlements', methods=['GET'])
+def get_settlement():
+    """
+    Transfers that settle a group's balances (?group=). ?method=greedy (default) pairs the largest
+    debtor with the largest creditor; ?method=exact finds the fewest transfers for groups of up to
+    NBS_SETTLE_EXACT_MAX_MEMBERS. Plans are cached and updated as bills are saved; ?refresh=1 re-solves.
+    """
+    group = request.args.get('group', DEFAULT_GROUP)
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    try:
+        return jsonify(settlements.settle(group, request.args.get('method', 'greedy'), refresh=refresh))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def prepare_for_fork():
+    """
+    Load what every worker of a pre-forking server can share: the templates
+    and the fork-safe OCR engines. Loaded in the parent, their memory is
+    shared copy-on-write by the workers instead of loaded once per worker.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    if app.config['WARMUP']:
+        warm_up(WARMUP_MODULES)
+    ocr_engines.preload(name for name in app.config['PRELOAD_ENGINES'] if ocr_engines.fork_safe(name))
+
+def start_warmup():
+    """Import the image/OCR stack in the background, so the first upload does not wait for it"""
+    if app.config['WARMUP']:
+        warm_up_in_background(WARMUP_MODULES)
+
+def after_fork():
+    """Set up a freshly forked worker: its own database connections and gRPC engines"""
+    member_store.reconnect()
+    bill_history.reconnect()
+    deferred = [name for name in app.config['PRELOAD_ENGINES'] if not ocr_engines.fork_safe(name)]
+    if deferred:
+        ocr_engines.preload_in_background(deferred)
+
+def shutdown_workers(wait: bool = True):
+    """Stop the extraction queue and worker pools; with ``wait`` queued work is finished first"""
+    extraction_jobs.shutdown(wait=wait)
+    with _pool_lock:
+        pools = [_tesseract_pool, _race_pool, _bulk_pool]
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
 if __name__ == '__main__':
+    # With the reloader on, this is set in the process that actually serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
     app.run(debug=True, host='0.0.0.0', port=5000)
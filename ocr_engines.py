@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+OCR engine registry for NBS - Newtown Bill Splitter App
+Loads each extraction backend (EasyOCR reader, Vision client, Gemini model) once per process.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+class EngineUnavailable(Exception):
+    """Raised when an engine is not installed or not configured"""
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, or 0 when it cannot be determined"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, but still shows what a load added
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+    except (ImportError, AttributeError):
+        return 0
+
+
+class _Engine:
+    def __init__(self, name: str, loader: Callable[[], Any], thread_safe: bool, fork_safe: bool):
+        self.name = name
+        self.loader = loader
+        self.thread_safe = thread_safe
+        self.fork_safe = fork_safe
+        self.instance = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+        self.uses = 0
+        self.load_lock = threading.Lock()
+        self.use_lock = threading.Lock()
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of lazily loaded, shared engine instances.
+
+    ``get`` loads an engine on first use (only one thread runs the loader)
+    and returns the same instance afterwards. Engines registered with
+    ``thread_safe=False`` should be used through ``using``, which serialises
+    calls on that instance. A load failure is remembered so later calls fail
+    fast instead of retrying the import on every receipt.
+    """
+
+    def __init__(self):
+        self._engines: Dict[str, _Engine] = {}
+
+    def register(self, name: str, loader: Callable[[], Any], thread_safe: bool = True, fork_safe: bool = True):
+        """
+        ``fork_safe=False`` marks engines that must not be loaded before the
+        server forks its workers (e.g. gRPC clients, whose channels break in
+        a forked child).
+        """
+        self._engines[name] = _Engine(name, loader, thread_safe, fork_safe)
+
+    def fork_safe(self, name: str) -> bool:
+        engine = self._engines.get(name)
+        return engine is not None and engine.fork_safe
+
+    def get(self, name: str) -> Any:
+        """Return the shared instance, loading it if needed"""
+        engine = self._engines[name]
+        if engine.instance is None:
+            with engine.load_lock:
+                if engine.instance is None:
+                    self._load(engine)
+        if engine.error:
+            raise EngineUnavailable(engine.error)
+        engine.uses += 1
+        return engine.instance
+
+    @contextmanager
+    def using(self, name: str) -> Iterator[Any]:
+        """Borrow an engine, holding its lock when it is not thread-safe"""
+        instance = self.get(name)
+        engine = self._engines[name]
+        if engine.thread_safe:
+            yield instance
+        else:
+            with engine.use_lock:
+                yield instance
+
+    def preload(self, names: Iterable[str]):
+        """Load the named engines now, ignoring ones that are unavailable"""
+        for name in names:
+            if name not in self._engines:
+                print(f"⚠️ Unknown OCR engine '{name}', skipping preload")
+                continue
+            try:
+                self.get(name)
+            except EngineUnavailable:
+                pass
+
+    def preload_in_background(self, names: Iterable[str]) -> threading.Thread:
+        thread = threading.Thread(target=self.preload, args=(list(names),),
+                                  name='engine-preload', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Load state, load time and memory added by each engine"""
+        return {
+            name: {
+                'loaded': engine.instance is not None,
+                'error': engine.error,
+                'load_seconds': round(engine.load_seconds, 3) if engine.load_seconds is not None else None,
+                'memory_mb': round(engine.memory_bytes / (1024 * 1024), 1) if engine.memory_bytes is not None else None,
+                'thread_safe': engine.thread_safe,
+                'uses': engine.uses,
+            }
+            for name, engine in self._engines.items()
+        }
+
+    def _load(self, engine: _Engine):
+        if engine.error:
+            return
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            engine.instance = engine.loader()
+        except EngineUnavailable as e:
+            engine.error = str(e)
+            print(f"⚠️ OCR engine '{engine.name}' unavailable: {e}")
+            return
+        except ImportError as e:
+            engine.error = f'Not installed: {e}'
+            print(f"⚠️ OCR engine '{engine.name}' not installed: {e}")
+            return
+        except Exception as e:
+            # Possibly transient (network, credentials); allow a later retry
+            print(f"❌ Failed to load OCR engine '{engine.name}': {e}")
+            raise EngineUnavailable(str(e))
+        engine.load_seconds = time.perf_counter() - start
+        engine.memory_bytes = max(current_rss_bytes() - rss_before, 0)
+        print(f"✅ Loaded OCR engine '{engine.name}' in {engine.load_seconds:.2f}s")
+
+
+def load_easyocr_reader():
+    import easyocr
+    return easyocr.Reader(['en'])
+
+
+def load_google_vision_client():
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+
+def load_gemini_model():
+    import google.generativeai as genai
+
+    # Get API key from environment variable
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise EngineUnavailable('GEMINI_API_KEY not found in environment variables')
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-1.5-flash')
+
+
+def create_default_registry() -> EngineRegistry:
+    registry = EngineRegistry()
+    # EasyOCR's reader keeps per-call state on a shared model, so calls are serialised
+    registry.register('easyocr', load_easyocr_reader, thread_safe=False)
+    # Both talk gRPC, so each forked worker loads its own
+    registry.register('google_vision', load_google_vision_client, fork_safe=False)
+    registry.register('gemini', load_gemini_model, fork_safe=False)
+    return registry
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+OCR worker functions for NBS - Newtown Bill Splitter App
+Kept separate from the Flask app so process-pool workers import as little as possible.
+"""
+
+import time
+from typing import Tuple
+
+import pytesseract
+
+
+def run_tesseract_config(image, config: str) -> Tuple[str, str, float, int, float]:
+    """
+    Run one Tesseract pass and score it by its word confidences.
+    Returns (config, text, mean word confidence 0-100, word count, seconds taken).
+    """
+    start = time.perf_counter()
+    try:
+        data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        # Some pytesseract errors cannot be unpickled, which would break the whole pool
+        raise RuntimeError(f'{type(e).__name__}: {e}') from None
+
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        confidence = float(data['conf'][i])
+        if not word.strip() or confidence < 0:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+
+    # Rebuild the text line by line, in Tesseract's reading order
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return config, text, mean_confidence, len(confidences), time.perf_counter() - start
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Request batching for NBS - Newtown Bill Splitter App
+Packs requests that arrive close together into one call to a backend that takes a batch.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _Batch:
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.payloads: List[Any] = []
+        self.futures: List[Future] = []
+        self.closed = False
+
+
+class RequestBatcher:
+    """
+    Runs ``handler`` on batches of payloads; the handler returns one result
+    per payload, in order.
+
+    There is no background thread: the first caller of run() opens a batch,
+    waits up to ``max_wait`` seconds for others to join (or until
+    ``max_batch`` payloads are in) and then makes the call on its own thread,
+    handing each caller its result. It only waits while another call is in
+    flight, since that is when others are arriving; a caller on its own is
+    sent straight away. A handler error is raised in every caller of that
+    batch.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch: int = 4, max_wait: float = 0.1):
+        self.handler = handler
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self._open: Optional[_Batch] = None
+        # Callers inside run(), waiting for a batch or for its result
+        self._in_flight = 0
+        self.batches = 0
+        self.requests = 0
+
+    def run(self, payload: Any) -> Any:
+        """Result for ``payload``, once its batch has been handled"""
+        if self.max_batch == 1:
+            with self._condition:
+                self.batches += 1
+                self.requests += 1
+            return self.handler([payload])[0]
+
+        future: Future = Future()
+        with self._condition:
+            self._in_flight += 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch(time.monotonic() + self.max_wait)
+            batch.payloads.append(payload)
+            batch.futures.append(future)
+            if len(batch.payloads) >= self.max_batch or self._in_flight == 1:
+                self._close(batch)
+            if leader:
+                while not batch.closed:
+                    remaining = batch.deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._close(batch)
+                        break
+                    self._condition.wait(remaining)
+                self.batches += 1
+                self.requests += len(batch.payloads)
+
+        try:
+            if leader:
+                try:
+                    results = self.handler(batch.payloads)
+                    if len(results) != len(batch.payloads):
+                        raise ValueError(f'Batch handler returned {len(results)} results for {len(batch.payloads)} requests')
+                except BaseException as e:
+                    for waiting in batch.futures:
+                        waiting.set_exception(e)
+                else:
+                    for waiting, result in zip(batch.futures, results):
+                        waiting.set_result(result)
+            return future.result()
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'mean_batch_size': round(self.requests / self.batches, 2) if self.batches else 0.0,
+            }
+
+    def _close(self, batch: _Batch):
+        batch.closed = True
+        if self._open is batch:
+            self._open = None
+        self._condition.notify_all()
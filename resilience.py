@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Resilience helpers for NBS - Newtown Bill Splitter App
+Deadlines, bounded retries and circuit breakers around remote extraction backends.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+
+class BackendUnavailable(Exception):
+    """Raised when a call is skipped because the backend's circuit is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a backend call does not finish within its deadline"""
+
+
+class PermanentBackendError(Exception):
+    """Raised by a wrapped call for an error that retrying cannot fix, such as a rejected request"""
+
+
+# 4xx responses that are worth retrying: request timeout and rate limiting
+TRANSIENT_HTTP_STATUSES = {408, 429}
+
+# gRPC status codes that retrying cannot fix: INVALID_ARGUMENT, NOT_FOUND, PERMISSION_DENIED,
+# FAILED_PRECONDITION, OUT_OF_RANGE, UNIMPLEMENTED and UNAUTHENTICATED
+PERMANENT_GRPC_CODES = {3, 5, 7, 9, 11, 12, 16}
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """
+    Whether ``error`` is the backend rejecting the call (a bad API key, an invalid
+    request) rather than the backend failing: PermanentBackendError, or an error
+    carrying a 4xx HTTP status other than 408/429 (google.api_core's ``code``,
+    or ``response.status_code`` for HTTP client errors)
+    """
+    if isinstance(error, PermanentBackendError):
+        return True
+    status = getattr(error, 'code', None)
+    if not isinstance(status, int):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in TRANSIENT_HTTP_STATUSES
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of one backend.
+
+    closed    - calls go through
+    open      - after ``failure_threshold`` consecutive failures; calls are
+                skipped for ``cool_off`` seconds
+    half_open - after the cool-off, one trial call is let through; success
+                closes the circuit, failure opens it again
+    """
+
+    def __init__(self, failure_threshold: int = 3, cool_off: float = 60):
+        self.failure_threshold = failure_threshold
+        self.cool_off = cool_off
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.skipped = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cool_off:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.skipped += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = 'closed'
+            self._trial_running = False
+
+    def record_failure(self, error: str):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            self._trial_running = False
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"⚡ Circuit opened after {self.consecutive_failures} failures: {error}")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def record_rejected(self, error: str):
+        """A permanent error: the backend answered, so it neither counts as a failure nor a success"""
+        with self._lock:
+            self.rejected += 1
+            self.last_error = error
+            self._trial_running = False
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self.state == 'open':
+                retry_in = max(self.cool_off - (time.monotonic() - self.opened_at), 0)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'retry_in_seconds': round(retry_in, 1) if retry_in is not None else None,
+                'last_error': self.last_error,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'skipped': self.skipped,
+            }
+
+
+class ResilientBackend:
+    """
+    Wraps calls to one remote backend with a per-attempt deadline, up to
+    ``retries`` retries with jittered exponential backoff, and a circuit
+    breaker. The wrapped callable is passed in per call, so tests and local
+    runs can point it at a fake backend. Errors for which ``permanent`` returns
+    True are raised at once, without retrying or counting toward the breaker.
+    """
+
+    def __init__(self, name: str, timeout: float = 15, retries: int = 1,
+                 backoff: float = 0.5, breaker: Optional[CircuitBreaker] = None,
+                 max_concurrent: int = 8, permanent: Callable[[Exception], bool] = is_permanent_error):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.permanent = permanent
+        # Calls run on these threads so a hung call can be abandoned at its deadline. An abandoned
+        # call keeps its thread until it returns, so each call holds a slot until then: once every
+        # slot is held by hung calls, new calls fail at their deadline instead of queueing behind them
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f'{name}-call')
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Call ``func(*args, **kwargs)``; raises BackendUnavailable when the
+        circuit is open, otherwise the last error once retries are used up
+        """
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise BackendUnavailable(f'{self.name} circuit is open') from last_error
+            try:
+                result = self._call_with_deadline(func, *args, **kwargs)
+            except Exception as e:
+                if self.permanent(e):
+                    self.breaker.record_rejected(f'{type(e).__name__}: {e}')
+                    print(f"⚠️ {self.name} rejected the call, not retrying: {e}")
+                    raise
+                last_error = e
+                self.breaker.record_failure(f'{type(e).__name__}: {e}')
+                print(f"⚠️ {self.name} attempt {attempt + 1}/{self.retries + 1} failed: {e}")
+                if attempt < self.retries:
+                    # Full jitter: sleep a random time up to the exponential backoff
+                    time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+                continue
+            self.breaker.record_success()
+            return result
+        raise last_error
+
+    def status(self) -> Dict[str, Any]:
+        status = self.breaker.status()
+        with self._abandoned_lock:
+            status.update({'timeout': self.timeout, 'retries': self.retries, 'hung_calls': self._abandoned})
+        return status
+
+    def _call_with_deadline(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise DeadlineExceeded(f'{self.name} has no free call thread: '
+                                   f'{self._abandoned} earlier calls are still hung')
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Still running: it keeps its thread and slot until it returns
+                with self._abandoned_lock:
+                    self._abandoned += 1
+                future.add_done_callback(self._call_returned)
+            raise DeadlineExceeded(f'{self.name} did not respond within {self.timeout:g}s')
+
+    def _call_returned(self, future):
+        with self._abandoned_lock:
+            self._abandoned -= 1
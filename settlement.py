@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Debt settlement for NBS - Newtown Bill Splitter App
+Turns running member balances into the fewest transfers that settle a group.
+"""
+
+import heapq
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Above this many members with a non-zero balance the exact solver is not tried
+EXACT_MAX_MEMBERS = 16
+DEFAULT_TIME_BUDGET = 0.25
+
+Transfer = Tuple[str, str, int]
+
+
+def greedy_settlement(balances: Dict[str, int]) -> List[Transfer]:
+    """
+    Transfers (debtor, creditor, cents) settling ``balances`` (member -> paid
+    minus owed, in cents): repeatedly the largest debtor pays the largest
+    creditor as much as one of them needs. Every transfer clears at least one
+    member, so n members never need more than n - 1 transfers. If the
+    balances do not add up to zero, whatever is left over stays unsettled.
+    """
+    creditors = [(-amount, member) for member, amount in balances.items() if amount > 0]
+    debtors = [(amount, member) for member, amount in balances.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+
+def zero_sum_groups(balances: Dict[str, int], deadline: float) -> Optional[List[List[str]]]:
+    """
+    Split the members into as many groups as possible whose balances add up
+    to zero. Each group of k members settles in k - 1 transfers, so this
+    gives the minimum number of transfers overall. Dynamic programming over
+    member subsets; returns None past ``deadline`` (a perf_counter time).
+    """
+    members = sorted(member for member, amount in balances.items() if amount)
+    amounts = [balances[member] for member in members]
+    size = 1 << len(members)
+    sums = [0] * size
+    # best[mask]: most zero-sum groups a chain of removals down from mask passes through
+    best = [0] * size
+    for mask in range(1, size):
+        if not mask & 1023 and time.perf_counter() > deadline:
+            return None
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+        most = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] > most:
+                most = best[mask ^ bit]
+            rest ^= bit
+        best[mask] = most + (sums[mask] == 0)
+
+    # Walk one best chain back down; the members removed between two zero-sum masks form a group
+    groups = []
+    mask = boundary = size - 1
+    while mask:
+        target = best[mask] - (sums[mask] == 0)
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] == target:
+                break
+            rest ^= bit
+        mask ^= bit
+        if sums[mask] == 0:
+            removed = boundary ^ mask
+            groups.append([member for i, member in enumerate(members) if removed >> i & 1])
+            boundary = mask
+    return groups
+
+
+def transfers_for_groups(balances: Dict[str, int], groups: List[List[str]]) -> List[Transfer]:
+    transfers = []
+    for group in groups:
+        transfers.extend(greedy_settlement({member: balances[member] for member in group}))
+    return transfers
+
+
+class SettlementCache:
+    """
+    Settlement plans per group, kept up to date as bills are saved.
+
+    Subscribes to a BillHistory: each saved or deleted bill adjusts the
+    cached balances of its group instead of reloading them and drops its
+    cached plans, which are solved again on the next settle(). The exact
+    solver always works on the whole balance set: zero-sum groups from
+    before a bill can be merged differently afterwards, so keeping them
+    would not give the fewest transfers.
+    """
+
+    def __init__(self, history, exact_max_members: int = EXACT_MAX_MEMBERS,
+                 time_budget: float = DEFAULT_TIME_BUDGET):
+        self.history = history
+        self.exact_max_members = exact_max_members
+        self.time_budget = time_budget
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Bumped on every change, so a load that raced a change is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        history.add_listener(self._on_change)
+
+    def settle(self, group: str, method: str = 'greedy', refresh: bool = False) -> Dict[str, Any]:
+        """
+        Transfers settling a group's balances. ``method`` is 'greedy' or
+        'exact'; exact falls back to greedy (and says so) when the group is
+        too big or the time budget runs out.
+        """
+        if method not in ('greedy', 'exact'):
+            raise ValueError("method must be 'greedy' or 'exact'")
+        self.history.check_external_changes()
+        entry = self._entry(group)
+        with self._lock:
+            cached = entry['results'].get(method)
+            if cached is not None and not refresh:
+                self.hits += 1
+                return dict(cached, cached=True)
+            self.misses += 1
+            revision = entry['revision']
+            balances = dict(entry['balances'])
+
+        result = {'group': group, 'method': 'greedy', 'minimal': False}
+        if method == 'exact':
+            partition = self._solve_exact(balances)
+            if partition is not None:
+                transfers = transfers_for_groups(balances, partition)
+                result.update(method='exact', minimal=True)
+            else:
+                result['fallback'] = 'too many members or out of time for the exact solver'
+        if result['method'] == 'greedy':
+            transfers = greedy_settlement(balances)
+        result['transfers'] = [{'from': debtor, 'to': creditor, 'amount': amount / 100}
+                               for debtor, creditor, amount in transfers]
+        result['transactions'] = len(transfers)
+        unsettled = sum(balances.values())
+        if unsettled:
+            result['unsettled'] = unsettled / 100
+
+        with self._lock:
+            if self._entries.get(group) is entry and entry['revision'] == revision:
+                entry['results'][method] = result
+        return dict(result, cached=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'groups': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _solve_exact(self, balances: Dict[str, int]) -> Optional[List[List[str]]]:
+        """Zero-sum groups for the whole balance set, or None if it is too big or out of time"""
+        if len(balances) > self.exact_max_members:
+            return None
+        return zero_sum_groups(balances, time.perf_counter() + self.time_budget)
+
+    def _entry(self, group: str) -> Dict[str, Any]:
+        while True:
+            with self._lock:
+                entry = self._entries.get(group)
+                if entry is not None:
+                    return entry
+                generation = self._generation
+            balances = {member: amount for member, amount in self.history.balance_cents(group).items() if amount}
+            with self._lock:
+                if self._generation == generation:
+                    entry = self._entries[group] = {
+                        'balances': balances, 'revision': 0, 'results': {},
+                    }
+                    return entry
+
+    def _on_change(self, group: Optional[str], changes: Optional[Dict[str, int]]):
+        with self._lock:
+            self._generation += 1
+            if group is None:
+                self._entries.clear()
+                return
+            entry = self._entries.get(group)
+            if entry is None:
+                return
+            balances = entry['balances']
+            for member, change in changes.items():
+                amount = balances.get(member, 0) + change
+                if amount:
+                    balances[member] = amount
+                else:
+                    balances.pop(member, None)
+            entry['revision'] += 1
+            entry['results'] = {}
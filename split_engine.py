@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Vectorised split engine for NBS - Newtown Bill Splitter App
+NumPy version of calculate_totals for large group bills and batch reprocessing.
+"""
+
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def calculate_totals_vectorized(members: List[str], items: List[Dict[str, Any]],
+                                discount_percent: float = 0) -> Dict[str, Any]:
+    """
+    Calculate totals with array operations over every (item, member) share.
+
+    Returns the same result as calculate_totals, to the cent: each member's
+    shares are added up in item order and the discount is applied with the
+    same float operations as the Python loop, so both paths round the same
+    way. Members sharing an item get the same share dict object in their
+    item lists, so treat the result as read-only (it is only ever
+    serialised).
+    """
+    if not members or not items:
+        return {
+            'subtotal': 0,
+            'discount_percent': discount_percent,
+            'discount_amount': 0,
+            'final_total': 0,
+            'member_totals': {}
+        }
+
+    # Column per distinct member, in first-seen order (like the dict in calculate_totals)
+    columns: Dict[str, int] = {}
+    for member in members:
+        columns.setdefault(member, len(columns))
+    member_names = list(columns)
+
+    prices = np.fromiter((float(item['price']) for item in items), dtype=np.float64, count=len(items))
+    # Everyone listed shares the item, even names not in the member list
+    shared_with = np.fromiter((len(item.get('assignedTo') or []) for item in items), dtype=np.int64,
+                              count=len(items))
+
+    # Per-item share, identical for everyone sharing the item, so one entry is built per
+    # item and appended to each sharer's list (the member item lists are the bulk of the work)
+    shares = np.divide(prices, shared_with, out=np.zeros_like(prices), where=shared_with > 0)
+    share_prices = shares.tolist()
+    counts = shared_with.tolist()
+    member_items: List[List[Dict[str, Any]]] = [[] for _ in member_names]
+    rows, cols = [], []
+    for row, item in enumerate(items):
+        assigned = [columns[member] for member in item.get('assignedTo') or [] if member in columns]
+        if not assigned:
+            continue
+        share = {'name': item['name'], 'price': share_prices[row], 'shared_with': counts[row]}
+        for col in assigned:
+            member_items[col].append(share)
+        rows.extend([row] * len(assigned))
+        cols.extend(assigned)
+
+    # Every share added to its member's total (a member listed twice on an item counts twice).
+    # np.add.at adds in the order given, i.e. item order, exactly like the Python loop.
+    member_totals = np.zeros(len(member_names))
+    np.add.at(member_totals, np.array(cols, dtype=np.int64), shares[np.array(rows, dtype=np.int64)])
+
+    # Bill figures and the proportional discount, with the same operations as calculate_totals
+    subtotal = sum(prices.tolist())
+    discount_amount = (subtotal * discount_percent) / 100
+    paying = member_totals > 0
+    member_discounts = np.divide(member_totals, subtotal, out=np.zeros_like(member_totals), where=paying) * discount_amount
+    member_finals = np.where(paying, member_totals - member_discounts, 0.0)
+
+    totals = member_totals.tolist()
+    discounts = member_discounts.tolist()
+    finals = member_finals.tolist()
+    # calculate_totals reports plain 0 (not 0.0) for members with nothing to pay
+    for col, member_total in enumerate(totals):
+        if not member_items[col]:
+            totals[col] = 0
+        if member_total <= 0:
+            discounts[col] = finals[col] = 0
+
+    return {
+        'subtotal': round(subtotal, 2),
+        'discount_percent': discount_percent,
+        'discount_amount': round(discount_amount, 2),
+        'final_total': round(subtotal - discount_amount, 2),
+        'member_totals': {
+            member: {
+                'total': round(totals[col], 2),
+                'discount': round(discounts[col], 2),
+                'final_total': round(finals[col], 2),
+                'items': member_items[col]
+            }
+            for col, member in enumerate(member_names)
+        }
+    }
@@ -1,13 +1,53 @@
 #!/usr/bin/env python3
 """
 Simple startup script for NBS - Newtown Bill Splitter App
+
+    python start_app.py                 # development server (auto-reload, debugger)
+    python start_app.py --production    # pre-forked worker processes (or NBS_SERVE_MODE=production)
+    python start_app.py --profile-startup
 """
 
+import argparse
+import gc
+import importlib.util
+import json
+import shutil
 import sys
 import subprocess
 import os
 from pathlib import Path
 
+# Probe results from earlier launches; a probe reruns when what it checked has changed
+PROBE_CACHE_FILE = '.nbs_startup_cache.json'
+
+# pip package -> module it provides
+REQUIRED_PACKAGES = {
+    'flask': 'flask', 'werkzeug': 'werkzeug', 'jinja2': 'jinja2', 'pillow': 'PIL',
+    'python-multipart': 'multipart', 'requests': 'requests', 'opencv-python': 'cv2',
+    'pytesseract': 'pytesseract', 'numpy': 'numpy',
+}
+
+def load_probe_cache():
+    try:
+        with open(PROBE_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_probe_cache(cache):
+    try:
+        with open(PROBE_CACHE_FILE, 'w') as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print(f"⚠️  Could not save {PROBE_CACHE_FILE}: {e}")
+
+def file_stamp(path):
+    """Path and modification time, or None if the file does not exist"""
+    try:
+        return [str(path), os.stat(path).st_mtime]
+    except (OSError, TypeError):
+        return None
+
 def check_python_version():
     """Check if Python version is compatible"""
     if sys.version_info < (3, 8):
@@ -18,20 +58,19 @@ def check_python_version():
     return True
 
 def check_dependencies():
-    """Check if required packages are installed"""
-    required_packages = [
-        'flask', 'werkzeug', 'jinja2', 'pillow', 
-        'python-multipart', 'requests', 'opencv-python', 
-        'pytesseract', 'numpy'
-    ]
-    
-    missing_packages = []
-    
-    for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
-        except ImportError:
-            missing_packages.append(package)
+    """
+    Check if required packages are installed. Packages are located without
+    importing them, and a passing result is reused until the interpreter or
+    its site-packages change.
+    """
+    cache = load_probe_cache()
+    key = [sys.executable, sys.version] + [file_stamp(path) for path in sys.path if path.endswith('site-packages')]
+    if cache.get('dependencies') == key:
+        print("✅ All required packages are installed (cached)")
+        return True
+
+    missing_packages = [package for package, module in REQUIRED_PACKAGES.items()
+                        if importlib.util.find_spec(module) is None]
     
     if missing_packages:
         print("❌ Missing required packages:")
@@ -48,15 +87,27 @@ def check_dependencies():
             return False
     
     print("✅ All required packages are installed")
+    cache['dependencies'] = key
+    save_probe_cache(cache)
     return True
 
 def check_tesseract():
-    """Check if Tesseract OCR is available"""
+    """Check if Tesseract OCR is available (rerun only when the tesseract binary changes)"""
+    cache = load_probe_cache()
+    key = file_stamp(shutil.which('tesseract'))
+    cached = cache.get('tesseract')
+    if key is not None and cached and cached.get('key') == key:
+        print(f"✅ Tesseract OCR is available (cached: {cached['version']})")
+        return True
+
     try:
         result = subprocess.run(['tesseract', '--version'], 
                               capture_output=True, text=True, timeout=5)
         if result.returncode == 0:
             print("✅ Tesseract OCR is available")
+            output = (result.stdout or result.stderr).splitlines()
+            cache['tesseract'] = {'key': key, 'version': output[0] if output else 'tesseract'}
+            save_probe_cache(cache)
             return True
     except (subprocess.TimeoutExpired, FileNotFoundError):
         pass
@@ -90,8 +141,126 @@ def check_project_structure():
     print("✅ Project structure is correct")
     return True
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Start NBS - Newtown Bill Splitter App')
+    parser.add_argument('--production', action='store_true',
+                        default=os.getenv('NBS_SERVE_MODE', 'dev') == 'production',
+                        help='serve with pre-forked worker processes instead of the development server')
+    parser.add_argument('--host', default=os.getenv('NBS_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('NBS_PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('NBS_WORKERS', str(os.cpu_count() or 2))),
+                        help='worker processes (production); with more than one, the proxy in front must '
+                             'route each client to the same worker (bill sessions, jobs and limits are per worker)')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('NBS_THREADS', '4')),
+                        help='request threads per worker (production)')
+    parser.add_argument('--max-requests', type=int, default=int(os.getenv('NBS_MAX_REQUESTS', '1000')),
+                        help='replace a worker after this many requests, 0 = never (production)')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.getenv('NBS_GRACEFUL_TIMEOUT', '30')),
+                        help='seconds a stopping worker gets to finish its requests (production)')
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('NBS_WORKER_TIMEOUT', '120')),
+                        help='restart a worker that stops responding for this long (production)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report the import time of each module at startup and during warm-up, then exit')
+    return parser.parse_args()
+
+def parse_importtime(lines):
+    """(module, self seconds, cumulative seconds, depth) from python -X importtime output"""
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return modules
+
+def profile_startup(top=15):
+    """
+    Import the app in a fresh interpreter with -X importtime, then warm up the
+    image/OCR stack, and report where the time went in each phase.
+    """
+    marker = 'NBS-WARMUP-STARTS'
+    code = ('import sys, time; start = time.perf_counter(); import nbs_billsplitter_app as nbs; '
+            'imported = time.perf_counter(); '
+            f'print("{marker}", file=sys.stderr, flush=True); nbs.warm_up(nbs.WARMUP_MODULES); '
+            'print(imported - start, time.perf_counter() - imported)')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        print("❌ Could not import the app")
+        return
+    app_seconds, warmup_seconds = (float(value) for value in result.stdout.split()[-2:])
+    lines = result.stderr.splitlines()
+    split = lines.index(marker) if marker in lines else len(lines)
+
+    # Direct imports are depth 1 under nbs_billsplitter_app, depth 0 when warm_up imports them
+    for title, seconds, phase, depth in (('App import', app_seconds, lines[:split], 1),
+                                         ('Warm-up (image/OCR stack)', warmup_seconds, lines[split + 1:], 0)):
+        modules = parse_importtime(phase)
+        print(f"\n⏱️  {title}: {seconds * 1000:.0f} ms, {len(modules)} modules")
+        print(f"   {'module':<40} {'self ms':>9} {'total ms':>9}")
+        for name, self_seconds, cumulative, _ in sorted(modules, key=lambda m: -m[1])[:top]:
+            print(f"   {name:<40} {self_seconds * 1000:>9.1f} {cumulative * 1000:>9.1f}")
+        direct = sorted((m for m in modules if m[3] == depth), key=lambda m: -m[2])[:5]
+        print("   Slowest direct imports: " + ', '.join(f'{m[0]} {m[2] * 1000:.0f} ms' for m in direct))
+
+def serve_production(args):
+    """
+    Serve with gunicorn: the app, its templates and fork-safe OCR engines are
+    loaded once in the master and the workers are forked from it, so they
+    share that memory copy-on-write. Workers are replaced after
+    --max-requests requests (jittered so they do not all restart together),
+    and SIGTERM lets in-flight requests and queued extraction jobs finish.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ Production mode needs gunicorn (Linux/macOS): pip install gunicorn")
+        return
+
+    # Tells the app to leave engine preloading to us, before the fork
+    os.environ['NBS_SERVE_MODE'] = 'production'
+
+    class NBSServer(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                'bind': f'{args.host}:{args.port}',
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                'preload_app': True,
+                'max_requests': args.max_requests,
+                'max_requests_jitter': max(args.max_requests // 10, 0),
+                'graceful_timeout': args.graceful_timeout,
+                'timeout': args.timeout,
+                'post_fork': lambda server, worker: nbs.after_fork(),
+                'worker_exit': lambda server, worker: nbs.shutdown_workers(),
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return nbs.app
+
+    import nbs_billsplitter_app as nbs
+    nbs.prepare_for_fork()
+    # Keep what is loaded now out of the garbage collector's way, so collections in the
+    # workers do not touch (and so copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    print(f"🏭 Production mode: {args.workers} workers x {args.threads} threads, "
+          f"recycled every ~{args.max_requests} requests")
+    if args.workers > 1:
+        print("⚠️ Bill sessions, extraction jobs and admission limits are kept per worker: route each client "
+              "to one worker (sticky sessions, e.g. nginx ip_hash)")
+    NBSServer().run()
+
 def main():
     """Main startup function"""
+    args = parse_args()
+    if args.profile_startup:
+        profile_startup()
+        return
     print("🧾 NBS - Newtown Bill Splitter App")
     print("=" * 40)
     
@@ -115,14 +284,20 @@ def main():
     
     print("\n" + "=" * 40)
     print("🚀 Starting NBS - Newtown Bill Splitter App...")
-    print("🌐 The app will be available at: http://localhost:5000")
+    print(f"🌐 The app will be available at: http://localhost:{args.port}")
     print("📱 Press Ctrl+C to stop the server")
     print("=" * 40)
     
     try:
+        if args.production:
+            serve_production(args)
+            return
         # Import and run the Flask app
-        from nbs_billsplitter_app import app
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        import nbs_billsplitter_app as nbs
+        # With the reloader on, this is set in the process that actually serves requests
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            nbs.start_warmup()
+        nbs.app.run(debug=True, host=args.host, port=args.port)
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
     except Exception as e: